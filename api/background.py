@@ -0,0 +1,41 @@
+# File: api/background.py
+"""Pieces shared by the subsystems that keep working off the request path"""
+import os
+import threading
+import time
+
+
+def today():
+    """UTC day that daily counters in the shared store are keyed by"""
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+
+class BackgroundThreads:
+    """Daemon threads started on first use, and again in every forked process
+
+    Threads do not survive a fork, so under a pre-forking server (gunicorn
+    with preload_app) each worker process starts its own. targets are
+    (function, thread name) pairs; on_start, if given, runs before they are
+    started in a new process, e.g. to drop state inherited from the parent.
+    """
+
+    def __init__(self, *targets, on_start=None):
+        self.targets = targets
+        self.on_start = on_start
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def started(self):
+        return self._pid == os.getpid()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                if self.on_start:
+                    self.on_start()
+                for target, name in self.targets:
+                    threading.Thread(target=target, name=name, daemon=True).start()
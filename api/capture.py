@@ -0,0 +1,96 @@
+# File: api/capture.py
+"""Opt-in capture of anonymized chat traffic for production-shaped load tests
+
+Each chat turn becomes one compact JSON line, written off the request path
+by a ConversationLogger (gzip-compressed, rotated). No text is kept, only
+the shape and timing of the turn:
+
+  t    start time (unix seconds)
+  s    session id, salted hash
+  k    message plus history, salted hash (equal turns share it, so a replay
+       reproduces response-cache hits)
+  m    message length in characters
+  h    history turns
+  hc   history length in characters
+  src  how the turn was answered: triage, knowledge_base, openai, degraded,
+       cancelled, quota or rate_limited
+  st   HTTP status
+  ms   end-to-end latency in milliseconds
+  up   upstream attempts, each [request bytes, response bytes,
+       first byte ms, total ms, status (0 if no response)]
+
+benchmarks/replay_capture.py re-drives a capture against a local server.
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+import time
+
+_current = threading.local()
+
+
+def note_upstream(request_bytes, response_bytes, first_byte, total, status):
+    """Attach one upstream attempt to the turn being captured on this thread"""
+    record = getattr(_current, "record", None)
+    if record is not None:
+        record["up"].append([request_bytes, response_bytes, round(first_byte * 1000, 1),
+                             round(total * 1000, 1), status])
+
+
+def answer_source(body, status):
+    """Which path answered a turn, from its response body"""
+    if body.get("source"):
+        return body["source"]
+    for flag in ("degraded", "cancelled", "error", "quota"):
+        if body.get(flag):
+            return flag
+    return "rate_limited" if status == 429 else "openai"
+
+
+class TrafficCapture:
+    """Records the shape of a sampled fraction of chat turns
+
+    The salt is random per process unless given, so hashes from different
+    workers only line up when CAPTURE_SALT is shared between them.
+    """
+
+    def __init__(self, writer, sample_rate=1.0, salt=None):
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self._salt = (salt or os.urandom(16).hex()).encode("utf-8")
+        self.captured = 0
+
+    def digest(self, text):
+        return hmac.new(self._salt, text.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+    def run(self, func, user_message, history, session):
+        """Call func() -> (body, status) for this turn and record its shape"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return func()
+        record = {
+            "t": round(time.time(), 3),
+            "s": self.digest(session) if session else "",
+            "k": self.digest(json.dumps([user_message, history], sort_keys=True)),
+            "m": len(user_message),
+            "h": len(history),
+            "hc": sum(len(str(turn.get("content") or "")) for turn in history if isinstance(turn, dict)),
+            "up": [],
+        }
+        _current.record = record
+        started = time.perf_counter()
+        try:
+            body, status = func()
+        finally:
+            _current.record = None
+        record["src"] = answer_source(body, status)
+        record["st"] = status
+        record["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if self.writer.log(record):
+            self.captured += 1
+        return body, status
+
+    def stats(self):
+        return dict(self.writer.stats(), sample_rate=self.sample_rate, captured=self.captured)
@@ -0,0 +1,177 @@
+# File: api/channel.py
+"""Multiplexed chat over one WebSocket per browser tab
+
+Frames are JSON text messages. From the page:
+  {"type": "chat", "id": ..., "message": ..., "history": [...], "speculative": bool, "key": ...}
+  {"type": "cancel", "id": ...}
+  {"type": "ping"}
+From the server:
+  {"type": "ready", "heartbeat": seconds}
+  {"type": "token", "id": ..., "delta": ...}      model output as it streams
+  {"type": "done", "id": ..., "status": ..., ...}  the /api/chat response body
+  {"type": "error", "id": ..., "error": ...}
+  {"type": "pong"}
+
+Several messages may be in flight at once; each runs on its own thread and
+is tagged with the id the page chose. Connections that send nothing (not
+even a ping) for two heartbeats are closed. When a connection drops, turns
+without an idempotency key are cancelled; keyed ones run to completion so
+the page's retry over HTTP can attach to them instead of starting again.
+
+An open connection holds a server thread for as long as the tab stays open,
+so a threaded worker admits only a limited number (see admit()); past that
+the upgrade is refused and the page keeps chatting over HTTP.
+"""
+import json
+import threading
+
+from api.deadline import Deadline
+
+
+class ChatChannel:
+    """Serves one WebSocket connection until it closes
+
+    answer(message, history, deadline, on_delta, key) -> (body, status)
+    produces one reply, key being the message's optional idempotency key;
+    speculative messages are registered with the speculation
+    registry so they show up in its waste accounting.
+    """
+
+    _lock = threading.Lock()
+    _counts = {"open": 0, "opened": 0, "refused": 0, "messages": 0, "cancelled": 0, "rejected": 0,
+               "idle_closed": 0}
+
+    def __init__(self, ws, answer, speculations, budget, heartbeat=25.0, max_in_flight=4):
+        self.ws = ws
+        self.answer = answer
+        self.speculations = speculations
+        self.budget = budget
+        self.heartbeat = heartbeat
+        self.max_in_flight = max_in_flight
+        self._send_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._in_flight = {}
+        self._closed = False
+
+    @classmethod
+    def stats(cls):
+        with cls._lock:
+            return dict(cls._counts)
+
+    @classmethod
+    def admit(cls, limit):
+        """Take one of `limit` connection slots (0 = unlimited); False when all are taken
+
+        Called before the upgrade, so a refused page sees a failed handshake;
+        every admitted connection must be given back with release().
+        """
+        with cls._lock:
+            if limit and cls._counts["open"] >= limit:
+                cls._counts["refused"] += 1
+                return False
+            cls._counts["open"] += 1
+            return True
+
+    @classmethod
+    def release(cls):
+        cls._count("open", -1)
+
+    @classmethod
+    def _count(cls, name, amount=1):
+        with cls._lock:
+            cls._counts[name] += amount
+
+    def serve(self):
+        """Read frames until the connection closes or goes idle"""
+        self._count("opened")
+        try:
+            self.send({"type": "ready", "heartbeat": self.heartbeat})
+            while True:
+                try:
+                    raw = self.ws.receive(timeout=self.heartbeat * 2)
+                except Exception:
+                    break
+                if raw is None:
+                    self._count("idle_closed")
+                    self.ws.close()
+                    break
+                try:
+                    frame = json.loads(raw)
+                except ValueError:
+                    continue
+                if not isinstance(frame, dict):
+                    continue
+                kind = frame.get("type")
+                if kind == "ping":
+                    self.send({"type": "pong"})
+                elif kind == "chat":
+                    self._start(frame)
+                elif kind == "cancel":
+                    self._cancel(str(frame.get("id", "")))
+        finally:
+            self._closed = True
+            # Nobody is left to read the answers, except retries of keyed turns
+            with self._state_lock:
+                in_flight = list(self._in_flight.values())
+            for deadline, _, keyed in in_flight:
+                if not keyed:
+                    deadline.cancel()
+
+    def send(self, frame):
+        """Send a frame; returns False once the connection is gone"""
+        if self._closed:
+            return False
+        try:
+            with self._send_lock:
+                self.ws.send(json.dumps(frame))
+            return True
+        except Exception:
+            self._closed = True
+            return False
+
+    def _start(self, frame):
+        message_id = str(frame.get("id", ""))[:64]
+        speculative = bool(frame.get("speculative"))
+        keyed = bool(frame.get("key"))
+        with self._state_lock:
+            busy = len(self._in_flight) >= self.max_in_flight or message_id in self._in_flight
+            if not busy:
+                deadline = Deadline(self.budget)
+                self._in_flight[message_id] = (deadline, speculative, keyed)
+        if busy:
+            self._count("rejected")
+            self.send({"type": "error", "id": message_id, "error": "too many messages in flight"})
+            return
+        self._count("messages")
+        if speculative:
+            self.speculations.register(message_id, deadline)
+        worker = threading.Thread(target=self._run, args=(message_id, frame, deadline, speculative, keyed),
+                                  name="chat-channel", daemon=True)
+        worker.start()
+
+    def _run(self, message_id, frame, deadline, speculative, keyed):
+        def on_delta(delta):
+            if not self.send({"type": "token", "id": message_id, "delta": delta}) and not keyed:
+                deadline.cancel()
+
+        try:
+            body, status = self.answer(str(frame.get("message", "")), frame.get("history") or [],
+                                       deadline, on_delta, str(frame.get("key") or ""))
+            self.send(dict(body, type="done", id=message_id, status=status))
+        except Exception as e:
+            self.send({"type": "error", "id": message_id, "error": str(e)})
+        finally:
+            with self._state_lock:
+                self._in_flight.pop(message_id, None)
+            if speculative:
+                self.speculations.finish(message_id)
+
+    def _cancel(self, message_id):
+        with self._state_lock:
+            deadline, speculative, _ = self._in_flight.get(message_id, (None, False, False))
+        if deadline is None:
+            return
+        self._count("cancelled")
+        if speculative:
+            self.speculations.cancel(message_id)
+        deadline.cancel()
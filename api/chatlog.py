@@ -0,0 +1,201 @@
+# File: api/chatlog.py
+"""Asynchronous batched conversation logging to rotating, compressed JSONL files"""
+import gzip
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+from api.background import BackgroundThreads
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+PHONE_RE = re.compile(r"(?<!\w)\+?\d[\d ().-]{7,}\d(?!\w)")
+
+
+def redact_pii(record):
+    """Default redaction hook: mask email addresses and phone numbers in text fields"""
+    for field in ("message", "response"):
+        value = record.get(field)
+        if isinstance(value, str):
+            value = EMAIL_RE.sub("[email]", value)
+            record[field] = PHONE_RE.sub("[phone]", value)
+    return record
+
+
+class ConversationLogger:
+    """Bounded queue drained by a background writer thread
+
+    Request handlers call log(), which never blocks: once the queue passes
+    the high watermark records are sampled (or dropped outright when full),
+    so a slow disk can never add latency to a chat turn.
+    """
+
+    def __init__(self, directory, max_queue=10000, batch_size=200, flush_interval=1.0,
+                 max_file_bytes=50 * 1024 * 1024, rotate_seconds=3600,
+                 overflow="sample", sample_rate=0.1, high_watermark=0.8, redactors=None, prefix="chat"):
+        self.directory = directory
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.rotate_seconds = rotate_seconds
+        self.overflow = overflow
+        self.sample_rate = sample_rate
+        self.high_watermark = int(max_queue * high_watermark)
+        self.redactors = list(redactors if redactors is not None else [redact_pii])
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._writer = BackgroundThreads((self._run, "%s-log-writer" % prefix), on_start=self._forget_file)
+        self._file = None
+        self._file_path = None
+        self._file_bytes = 0
+        self._file_opened = 0.0
+        self._sequence = 0
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.redacted_out = 0
+        self.errors = 0
+        self.batches = 0
+        self.files = 0
+        self.flush_total = 0.0
+        self.flush_last = 0.0
+        self.flush_max = 0.0
+
+    def add_redactor(self, redactor):
+        """Register a hook that receives each record and returns it (or None to drop it)"""
+        self.redactors.append(redactor)
+
+    def log(self, record):
+        """Enqueue a record without blocking; returns False if it was shed"""
+        self._writer.ensure_started()
+        if self.overflow == "sample" and self._queue.qsize() >= self.high_watermark:
+            if random.random() >= self.sample_rate:
+                self.sampled_out += 1
+                return False
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def flush(self, timeout=5.0):
+        """Wait until everything enqueued so far has been written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        """Flush pending records and close the current file"""
+        if self._writer.started:
+            self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        """Counters for the metrics endpoint"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "redacted_out": self.redacted_out,
+            "errors": self.errors,
+            "batches": self.batches,
+            "files": self.files,
+            "flush_ms_last": round(self.flush_last * 1000, 3),
+            "flush_ms_avg": round(self.flush_total * 1000 / self.batches, 3) if self.batches else 0.0,
+            "flush_ms_max": round(self.flush_max * 1000, 3),
+        }
+
+    def _forget_file(self):
+        # A file opened by the parent process belongs to the parent's writer.
+        # Detach it before dropping it: finalizing it here would write a gzip
+        # trailer into the middle of the parent's stream.
+        with self._lock:
+            if self._file is not None:
+                self._file.fileobj = None
+            self._file = None
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                with self._lock:
+                    self._maybe_rotate()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                self.errors += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        lines = []
+        for record in batch:
+            for redactor in self.redactors:
+                record = redactor(record)
+                if record is None:
+                    break
+            if record is None:
+                self.redacted_out += 1
+                continue
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        if not lines:
+            return
+
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with self._lock:
+            self._maybe_rotate(len(data))
+            self._file.write(data)
+            self._file.flush()
+            self._file_bytes += len(data)
+
+        elapsed = time.perf_counter() - start
+        self.written += len(lines)
+        self.batches += 1
+        self.flush_last = elapsed
+        self.flush_total += elapsed
+        self.flush_max = max(self.flush_max, elapsed)
+
+    def _maybe_rotate(self, incoming=0):
+        # Size is measured before compression so rotation is predictable
+        if self._file is not None:
+            too_big = self._file_bytes + incoming > self.max_file_bytes
+            too_old = time.time() - self._file_opened >= self.rotate_seconds
+            if not (too_big or too_old):
+                return
+            self._file.close()
+            self._file = None
+        if not incoming:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = "%s-%s-%d-%d.jsonl.gz" % (self.prefix, time.strftime("%Y%m%d-%H%M%S"), os.getpid(), self._sequence)
+        self._file_path = os.path.join(self.directory, name)
+        self._file = gzip.open(self._file_path, "ab")
+        self._file_bytes = 0
+        self._file_opened = time.time()
+        self.files += 1
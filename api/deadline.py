@@ -0,0 +1,65 @@
+# File: api/deadline.py
+"""Request-scoped deadlines shared by every stage of a chat turn"""
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage starts or runs past the request deadline"""
+
+    def __init__(self, stage):
+        super().__init__(f"deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class RequestCancelled(DeadlineExceeded):
+    """Raised when the client withdrew the request, e.g. a replaced speculation"""
+
+    def __init__(self, stage):
+        Exception.__init__(self, f"request cancelled during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Absolute point in time by which a request must have answered"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.cancelled = False
+        self._cancel_callbacks = []
+
+    def cancel(self):
+        """Expire immediately and interrupt whatever the request is blocked on"""
+        self.cancelled = True
+        for callback in self._cancel_callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """Register a callback that aborts a blocking operation on cancel"""
+        self._cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    def remaining(self):
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage):
+        """Raise DeadlineExceeded if no budget is left for the given stage"""
+        if self.cancelled:
+            raise RequestCancelled(stage)
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, stage, cap=None):
+        """Socket timeout for the next blocking operation of a stage"""
+        self.check(stage)
+        # A zero timeout would switch the socket to non-blocking mode
+        remaining = max(self.remaining(), 0.001)
+        return remaining if cap is None else min(cap, remaining)
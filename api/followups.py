@@ -0,0 +1,160 @@
+# File: api/followups.py
+"""Suggested follow-up questions, with their answers computed ahead of time
+
+After a model answer the page gets a token; a background thread asks for a
+few likely follow-up questions, publishes them under that token (the page
+long-polls for them and shows chips) and then answers the first few while
+the daily token budget allows. Asking a suggested question with the same
+history is then served from the precomputed answer without a model call.
+
+State lives in the shared store:
+  followups        token -> {"status": "pending" | "ready", "questions": [...]}
+  followup-answers hash of (session, history, question) -> {"body", "tokens"}
+  followup-stats   "<day>|<counter>" -> daily totals across workers
+
+The wasted-token ratio is the share of precompute tokens whose answer was
+never asked for; together with the hit rate it is what the budget is tuned on.
+Speculative spend counts against the daily budget only; a user is charged
+for a precomputed answer when it is served to them.
+"""
+import hashlib
+import json
+import queue
+import secrets
+import time
+
+from api.background import BackgroundThreads, today
+
+COUNTERS = ("turns", "suggested", "precomputed", "hits", "skipped_budget", "failed",
+            "suggest_tokens", "precompute_tokens", "served_tokens")
+
+
+def total_tokens(usage):
+    return usage.get("total_tokens") or usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+
+def answer_key(session, history, question):
+    payload = json.dumps([session, history, question.strip().lower()], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FollowUps:
+    """Suggests follow-ups and precomputes their answers off the request path
+
+    suggest(conversation, account) -> (questions, usage) and
+    precompute(question, conversation, account) -> (body, usage) or None
+    (None when the question is answered locally anyway) do the upstream work;
+    usage is the response's "usage" block.
+    """
+
+    def __init__(self, store, suggest, precompute, count=3, precompute_count=2, daily_tokens=0,
+                 ttl=900, max_queue=100, poll_interval=0.25):
+        self.store = store
+        self.suggest = suggest
+        self.precompute = precompute
+        self.count = count
+        self.precompute_count = precompute_count
+        self.daily_tokens = daily_tokens
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = BackgroundThreads((self._run, "followup-precompute"))
+        self.dropped = 0
+
+    def schedule(self, session, conversation, account=None):
+        """Queue suggestions for the turn that just ended; returns the token to poll, or None"""
+        if not session:
+            return None
+        self._worker.ensure_started()
+        token = secrets.token_urlsafe(12)
+        self.store.set("followups", token, {"status": "pending", "questions": []}, ttl=self.ttl)
+        try:
+            self._queue.put_nowait((token, session, conversation, account))
+        except queue.Full:
+            self.store.delete("followups", token)
+            self.dropped += 1
+            return None
+        self._count("turns")
+        return token
+
+    def questions(self, token, wait=0.0):
+        """The suggestions published under a token, waiting up to `wait` seconds for them"""
+        record = self.store.get("followups", token)
+        stop = time.monotonic() + wait
+        while record is not None and record["status"] == "pending" and time.monotonic() < stop:
+            time.sleep(min(self.poll_interval, max(0.0, stop - time.monotonic())))
+            record = self.store.get("followups", token)
+        return record
+
+    def take(self, session, history, question):
+        """Precomputed (body, usage) for this question in this conversation, consumed once"""
+        if not session:
+            return None
+        key = answer_key(session, history, question)
+        entry = self.store.get("followup-answers", key)
+        if entry is None:
+            return None
+        self.store.delete("followup-answers", key)
+        self._count("hits")
+        self._count("served_tokens", total_tokens(entry["usage"]))
+        return entry["body"], entry["usage"]
+
+    def stats(self, day=None):
+        day = day or today()
+        totals = dict.fromkeys(COUNTERS, 0)
+        for key, value in self.store.scan("followup-stats", day + "|"):
+            totals[key.split("|", 1)[1]] = value
+        spent = totals["precompute_tokens"]
+        return dict(
+            totals,
+            day=day,
+            dropped=self.dropped,
+            hit_rate=round(totals["hits"] / totals["precomputed"], 4) if totals["precomputed"] else 0.0,
+            wasted_token_ratio=round(max(0, spent - totals["served_tokens"]) / spent, 4) if spent else 0.0,
+        )
+
+    def _count(self, counter, amount=1):
+        self.store.incr("followup-stats", "%s|%s" % (today(), counter), amount, ttl=8 * 86400)
+
+    def _budget_left(self):
+        if not self.daily_tokens:
+            return True
+        used = self.store.get("followup-stats", "%s|suggest_tokens" % today(), 0)
+        used += self.store.get("followup-stats", "%s|precompute_tokens" % today(), 0)
+        return used < self.daily_tokens
+
+    def _run(self):
+        while True:
+            token, session, conversation, account = self._queue.get()
+            try:
+                self._prepare(token, session, conversation, account)
+            except Exception:
+                self._count("failed")
+                self.store.set("followups", token, {"status": "ready", "questions": []}, ttl=self.ttl)
+            finally:
+                self._queue.task_done()
+
+    def _prepare(self, token, session, conversation, account):
+        if not self._budget_left():
+            self._count("skipped_budget")
+            self.store.set("followups", token, {"status": "ready", "questions": []}, ttl=self.ttl)
+            return
+        questions, usage = self.suggest(conversation, account)
+        questions = questions[:self.count]
+        self._count("suggest_tokens", total_tokens(usage))
+        self._count("suggested", len(questions))
+        self.store.set("followups", token, {"status": "ready", "questions": questions}, ttl=self.ttl)
+
+        for question in questions[:self.precompute_count]:
+            if not self._budget_left():
+                self._count("skipped_budget")
+                break
+            result = self.precompute(question, conversation, account)
+            if result is None:
+                continue
+            body, usage = result
+            self._count("precompute_tokens", total_tokens(usage))
+            self._count("precomputed")
+            self.store.set("followup-answers", answer_key(session, conversation, question),
+                           {"body": body, "usage": usage}, ttl=self.ttl)
@@ -0,0 +1,84 @@
+# File: api/idempotency.py
+"""Idempotency keys: a retried chat request never runs its turn twice
+
+The first request with a key claims it in the shared store and runs; its
+successful result is kept for the TTL. A retry that arrives meanwhile waits
+for that result (in any worker), one that arrives later gets the stored
+result back. A key reused for a different request is rejected. Failed,
+degraded, cancelled or throttled turns (any status other than 200, or a
+body flagged "degraded" or "cancelled") release the key so a retry can
+run again.
+
+Entries live in the store's "idempotency" namespace, so memory is bounded
+by the store (MemoryStore evicts the least recently used entries) and every
+entry expires.
+"""
+import hashlib
+import json
+import time
+
+
+class IdempotencyKeys:
+    """Runs chat turns at most once per key"""
+
+    def __init__(self, store, ttl=600, poll_interval=0.05):
+        self.store = store
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.executed = 0
+        self.replayed = 0
+        self.attached = 0
+        self.conflicts = 0
+
+    @staticmethod
+    def fingerprint(payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def run(self, key, payload, func, deadline):
+        """Call func() -> (body, status) unless this key already ran
+
+        Returns (body, status, replayed). Waiting on an in-flight duplicate
+        is bounded by the deadline; a 409 is returned if it runs out.
+        """
+        fingerprint = self.fingerprint(payload)
+        attached = False
+        while True:
+            record = self.store.get("idempotency", key)
+            if record is None:
+                claim = {"status": "running", "fingerprint": fingerprint}
+                if self.store.add("idempotency", key, claim, ttl=deadline.remaining() + 1):
+                    break
+                continue
+            if record["fingerprint"] != fingerprint:
+                self.conflicts += 1
+                return {"error": "Idempotency-Key was already used for a different request"}, 422, False
+            if record["status"] == "done":
+                self.replayed += 1
+                return record["body"], record["http_status"], True
+            if not attached:
+                attached = True
+                self.attached += 1
+            if deadline.expired():
+                return {"error": "A request with this Idempotency-Key is still in progress"}, 409, False
+            time.sleep(min(self.poll_interval, deadline.remaining()))
+
+        try:
+            body, status = func()
+        except BaseException:
+            self.store.delete("idempotency", key)
+            raise
+        self.executed += 1
+        if status == 200 and not (body.get("cancelled") or body.get("degraded")):
+            self.store.set("idempotency", key, {"status": "done", "fingerprint": fingerprint,
+                                                "body": body, "http_status": status}, ttl=self.ttl)
+        else:
+            self.store.delete("idempotency", key)
+        return body, status, False
+
+    def stats(self):
+        return {
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "attached": self.attached,
+            "conflicts": self.conflicts,
+        }
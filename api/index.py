@@ -1,1032 +1,992 @@
 # File: api/index.py
-from flask import Flask, request, jsonify
+#
+# Cold starts on Vercel pay for everything done at import time, so only Flask
+# is imported eagerly (plus flask-sock where it is installed). The page, its
+# compressed variants, the knowledge base, the triage automaton, the chat
+# logger and the upstream SSL context are all built on first use.
+import os
+import time
+import threading
+from functools import wraps
 
-app = Flask(__name__)
+from flask import Flask, g, request, jsonify, make_response
 
-# HTML template - replace this with your full HTML
-HTML_TEMPLATE = """<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>HealthAssist Chatbot</title>
-    <!-- Bootstrap CSS -->
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.3.0/css/bootstrap.min.css" rel="stylesheet">
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap');
-        
-        :root {
-            --primary-color: #0088ff;
-            --primary-dark: #0066cc;
-            --secondary-color: #4caf50;
-            --secondary-dark: #388e3c;
-            --dark-bg: #ffffff;
-            --panel-bg: #f8f9fa;
-            --message-bg: #f0f2f5;
-            --user-message-bg: #0088ff;
-            --border-color: #e0e0e0;
-            --text-primary: #202124;
-            --text-secondary: #5f6368;
-            --text-muted: #9aa0a6;
-            --input-bg: #f8f9fa;
-            --highlight: rgba(0, 0, 0, 0.05);
-        }
-        
-        body {
-            font-family: 'Poppins', sans-serif;
-            background: #f5f5f5;
-            color: var(--text-primary);
-            height: 100vh;
-            overflow: hidden;
-            margin: 0;
-        }
-        
-        .chat-container {
-            max-width: 1200px;
-            margin: 20px auto;
-            height: calc(100vh - 40px);
-            display: flex;
-            flex-direction: column;
-            background-color: var(--dark-bg);
-            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-            position: relative;
-            overflow: hidden;
-            border-radius: 15px;
-        }
-        
-        .background-decoration {
-            position: absolute;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            overflow: hidden;
-            z-index: 0;
-        }
-        
-        .bg-circle {
-            position: absolute;
-            border-radius: 50%;
-            background: linear-gradient(135deg, rgba(76, 175, 80, 0.05), rgba(0, 136, 255, 0.05));
-            filter: blur(30px);
-        }
-        
-        .bg-circle-1 {
-            width: 400px;
-            height: 400px;
-            top: -100px;
-            left: -100px;
-        }
-        
-        .bg-circle-2 {
-            width: 500px;
-            height: 500px;
-            bottom: -200px;
-            right: -100px;
-            background: linear-gradient(135deg, rgba(0, 136, 255, 0.05), rgba(76, 175, 80, 0.05));
-        }
-        
-        .header {
-            padding: 16px 20px;
-            border-bottom: 1px solid var(--border-color);
-            background-color: #ffffff;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            z-index: 1;
-            position: relative;
-            box-shadow: 0 1px 3px rgba(0, 0, 0, 0.05);
-        }
-        
-        .logo {
-            display: flex;
-            align-items: center;
-            gap: 16px;
-        }
-        
-        .logo-icon {
-            width: 42px;
-            height: 42px;
-            border-radius: 12px;
-            background: linear-gradient(135deg, #4caf50, #0088ff);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            box-shadow: 0 2px 10px rgba(0, 136, 255, 0.5);
-        }
-        
-        .logo-text {
-            font-size: 24px;
-            font-weight: 600;
-            background: linear-gradient(90deg, #4caf50, #0088ff);
-            -webkit-background-clip: text;
-            background-clip: text;
-            -webkit-text-fill-color: transparent;
-            text-transform: none;
-            letter-spacing: 0.5px;
-        }
-        
-        .header-controls {
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        .header-button {
-            background-color: var(--panel-bg);
-            border: none;
-            width: 38px;
-            height: 38px;
-            border-radius: 10px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            color: var(--text-secondary);
-            cursor: pointer;
-            transition: all 0.3s;
-            box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-        }
-        
-        .header-button:hover {
-            background-color: var(--message-bg);
-            color: var(--text-primary);
-            transform: translateY(-2px);
-        }
-        
-        .chat-body {
-            flex-grow: 1;
-            overflow-y: auto;
-            padding: 10px;
-            background-color: transparent;
-            z-index: 1;
-            display: flex;
-            flex-direction: column;
-            scroll-behavior: smooth;
-        }
-        
-        .chat-body::-webkit-scrollbar {
-            width: 6px;
-        }
-        
-        .chat-body::-webkit-scrollbar-track {
-            background: transparent;
-        }
-        
-        .chat-body::-webkit-scrollbar-thumb {
-            background-color: var(--border-color);
-            border-radius: 6px;
-        }
-        
-        .message-container {
-            margin-bottom: 16px;
-            max-width: 85%;
-        }
-        
-        .user-container {
-            align-self: flex-end;
-            text-align: right;
-        }
-        
-        .bot-container {
-            align-self: flex-start;
-            text-align: left;
-        }
-        
-        .message {
-            display: inline-block;
-            padding: 12px 18px;
-            border-radius: 18px;
-            position: relative;
-            margin-bottom: 4px;
-            word-break: break-word;
-            box-shadow: 0 3px 10px rgba(0, 0, 0, 0.1);
-            animation: fadeIn 0.3s ease-out;
-        }
-        
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(10px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        
-        .user-message {
-            background: linear-gradient(135deg, var(--primary-color), var(--primary-dark));
-            color: white;
-            border-bottom-right-radius: 4px;
-            text-align: left;
-        }
-        
-        .bot-message {
-            background-color: var(--panel-bg);
-            border: 1px solid var(--border-color);
-            color: var(--text-primary);
-            border-bottom-left-radius: 4px;
-        }
-        
-        .bot-message-header {
-            display: flex;
-            align-items: center;
-            margin-bottom: 8px;
-        }
-        
-        .bot-icon {
-            width: 32px;
-            height: 32px;
-            border-radius: 50%;
-            background: linear-gradient(135deg, #4caf50, #0088ff);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            color: white;
-            font-weight: bold;
-            margin-right: 12px;
-            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.2);
-        }
-        
-        .message-time {
-            font-size: 11px;
-            color: var(--text-muted);
-            margin-top: 4px;
-            opacity: 0.8;
-        }
-        
-        .typing-indicator {
-            display: flex;
-            align-items: center;
-            gap: 4px;
-            padding: 8px 12px;
-            margin-top: 4px;
-        }
-        
-        .typing-dot {
-            width: 8px;
-            height: 8px;
-            background-color: var(--text-muted);
-            border-radius: 50%;
-            animation: typingAnimation 1.4s infinite;
-        }
-        
-        .typing-dot:nth-child(2) {
-            animation-delay: 0.2s;
-        }
-        
-        .typing-dot:nth-child(3) {
-            animation-delay: 0.4s;
-        }
-        
-        @keyframes typingAnimation {
-            0%, 60%, 100% { transform: translateY(0); }
-            30% { transform: translateY(-5px); }
-        }
-        
-        .footer {
-            padding: 16px 20px;
-            background-color: #ffffff;
-            border-top: 1px solid var(--border-color);
-            z-index: 1;
-            position: relative;
-            box-shadow: 0 -1px 3px rgba(0, 0, 0, 0.05);
-        }
-        
-        .input-container {
-            position: relative;
-            border-radius: 16px;
-            background-color: var(--input-bg);
-            border: 1px solid var(--border-color);
-            transition: all 0.3s;
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-            overflow: hidden;
-        }
-        
-        .input-container:focus-within {
-            box-shadow: 0 0 0 2px rgba(0, 136, 255, 0.3), 0 4px 12px rgba(0, 0, 0, 0.2);
-            border-color: var(--primary-color);
-        }
-        
-        .message-input {
-            border: none;
-            background: transparent;
-            padding: 16px 20px;
-            padding-right: 120px;
-            width: 100%;
-            resize: none;
-            min-height: 24px;
-            max-height: 200px;
-            color: var(--text-primary);
-            font-size: 15px;
-            line-height: 1.5;
-            font-family: 'Poppins', sans-serif;
-        }
-        
-        .message-input:focus {
-            outline: none;
-        }
-        
-        .message-input::placeholder {
-            color: var(--text-muted);
-        }
-        
-        .button-container {
-            position: absolute;
-            right: 10px;
-            bottom: 8px;
-            display: flex;
-            gap: 8px;
-            align-items: center;
-        }
-        
-        .action-button {
-            width: 42px;
-            height: 42px;
-            border-radius: 50%;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            background-color: transparent;
-            border: none;
-            color: var(--text-secondary);
-            cursor: pointer;
-            transition: all 0.2s;
-        }
-        
-        .action-button:hover {
-            background-color: var(--highlight);
-            color: var(--text-primary);
-        }
-        
-        .action-button i {
-            font-size: 20px;
-        }
-        
-        .send-button {
-            background: linear-gradient(135deg, #4caf50, #0088ff);
-            color: white;
-            width: 48px;
-            height: 48px;
-            box-shadow: 0 2px 8px rgba(0, 136, 255, 0.4);
-            transition: all 0.3s;
-        }
-        
-        .send-button:hover {
-            background: linear-gradient(135deg, #43a047, #0072cc);
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(0, 136, 255, 0.6);
-        }
-        
-        .voice-button {
-            background-color: rgba(0, 136, 255, 0.1);
-            color: var(--primary-color);
-        }
-        
-        .voice-button:hover {
-            background-color: rgba(0, 136, 255, 0.2);
-        }
-        
-        .voice-button.listening {
-            background: linear-gradient(135deg, #0088ff, #0066cc);
-            color: white;
-            box-shadow: 0 0 0 rgba(0, 136, 255, 0.4);
-            animation: pulse 1.5s infinite;
-        }
-        
-        @keyframes pulse {
-            0% {
-                box-shadow: 0 0 0 0 rgba(0, 136, 255, 0.4);
-            }
-            70% {
-                box-shadow: 0 0 0 8px rgba(0, 136, 255, 0);
-            }
-            100% {
-                box-shadow: 0 0 0 0 rgba(0, 136, 255, 0);
-            }
-        }
-        
-        .pulse-dot {
-            display: inline-block; 
-            width: 10px; 
-            height: 10px; 
-            background: linear-gradient(135deg, #4caf50, #0088ff);
-            border-radius: 50%; 
-            margin-right: 8px; 
-            animation: dot-pulse 1.5s infinite;
-        }
-        
-        @keyframes dot-pulse {
-            0% { opacity: 0.4; transform: scale(0.8); }
-            50% { opacity: 1; transform: scale(1); }
-            100% { opacity: 0.4; transform: scale(0.8); }
-        }
-        
-        .listening-indicator {
-            display: flex;
-            align-items: center;
-            color: var(--primary-color);
-            font-size: 14px;
-            font-weight: 500;
-            background-color: rgba(0, 136, 255, 0.1);
-            padding: 6px 12px;
-            border-radius: 20px;
-            visibility: hidden;
-        }
-        
-        .welcome-container {
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            height: 100%;
-            text-align: center;
-            padding: 0px;
-            margin-top: 0px;
-            position: relative;
-            z-index: 1;
-        }
-        
-        .welcome-logo {
-            width: 90px;
-            height: 90px;
-            border-radius: 24px;
-            background: linear-gradient(135deg, #4caf50, #0088ff);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            margin-bottom: 24px;
-            box-shadow: 0 10px 25px rgba(0, 136, 255, 0.4);
-            position: relative;
-            overflow: hidden;
-        }
-        
-        .welcome-logo::after {
-            content: '';
-            position: absolute;
-            top: -50%;
-            left: -50%;
-            width: 200%;
-            height: 200%;
-            background: linear-gradient(
-                to bottom right,
-                rgba(255, 255, 255, 0) 0%,
-                rgba(255, 255, 255, 0) 40%,
-                rgba(255, 255, 255, 0.4) 50%,
-                rgba(255, 255, 255, 0) 60%,
-                rgba(255, 255, 255, 0) 100%
-            );
-            transform: rotate(45deg);
-            animation: shine 3s infinite;
-        }
-        
-        @keyframes shine {
-            0% { transform: rotate(45deg) translateX(-100%); }
-            30%, 100% { transform: rotate(45deg) translateX(100%); }
-        }
-        
-        .welcome-title {
-            font-size: 32px;
-            font-weight: 700;
-            margin-bottom: 16px;
-            background: linear-gradient(90deg, #4caf50, #0088ff);
-            -webkit-background-clip: text;
-            background-clip: text;
-            -webkit-text-fill-color: transparent;
-            position: relative;
-            text-align: center;
-        }
-        
-        .welcome-subtitle {
-            font-size: 18px;
-            margin-bottom: 32px;
-            color: var(--text-secondary);
-            max-width: 600px;
-            line-height: 1.6;
-            text-align: center;
-        }
-        
-        .capability-chips {
-            display: flex;
-            flex-wrap: wrap;
-            justify-content: center;
-            gap: 12px;
-            margin-top: 16px;
-            max-width: 700px;
-        }
-        
-        .chip {
-            padding: 12px 20px;
-            background-color: var(--panel-bg);
-            border-radius: 12px;
-            font-size: 14px;
-            font-weight: 500;
-            border: 1px solid var(--border-color);
-            color: var(--text-primary);
-            cursor: pointer;
-            transition: all 0.3s;
-            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        
-        .chip svg {
-            color: var(--primary-color);
-            font-size: 16px;
-        }
-        
-        .chip:hover {
-            background-color: var(--message-bg);
-            border-color: var(--primary-color);
-            transform: translateY(-2px);
-            box-shadow: 0 4px 10px rgba(0, 0, 0, 0.2);
-        }
-        
-        @media (max-width: 768px) {
-            .chat-container {
-                height: 100vh;
-                width: 100%;
-                margin: 0;
-                border-radius: 0;
-            }
-            
-            .welcome-title {
-                font-size: 28px;
-            }
-            
-            .welcome-subtitle {
-                font-size: 16px;
-                padding: 0 20px;
-            }
-            
-            .message-container {
-                max-width: 90%;
-            }
-            
-            .capability-chips {
-                gap: 10px;
-                padding: 0 10px;
-            }
-            
-            .chip {
-                padding: 10px 16px;
-                font-size: 13px;
-            }
-            
-            .message-input {
-                padding-right: 100px;
-            }
-            
-            .header, .footer {
-                padding: 12px 16px;
-            }
-            
-            .action-button {
-                width: 38px;
-                height: 38px;
-            }
-            
-            .send-button {
-                width: 42px;
-                height: 42px;
-            }
-            
-            .logo-text {
-                font-size: 20px;
-            }
-            
-            .logo-icon {
-                width: 36px;
-                height: 36px;
-            }
-        }
-        
-        @media (max-width: 480px) {
-            .welcome-logo {
-                width: 70px;
-                height: 70px;
-            }
-            
-            .welcome-title {
-                font-size: 24px;
-            }
-            
-            .welcome-subtitle {
-                font-size: 14px;
-            }
-            
-            .chip {
-                padding: 8px 14px;
-                font-size: 12px;
-            }
-            
-            .message {
-                padding: 10px 14px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="chat-container">
-        <div class="background-decoration">
-            <div class="bg-circle bg-circle-1"></div>
-            <div class="bg-circle bg-circle-2"></div>
-        </div>
-        
-        <div class="header">
-            <div class="logo">
-                <div class="logo-icon">
-                    <svg xmlns="http://www.w3.org/2000/svg" width="22" height="22" fill="currentColor" viewBox="0 0 16 16">
-                        <path d="M8 4a.5.5 0 0 1 .5.5v3h3a.5.5 0 0 1 0 1h-3v3a.5.5 0 0 1-1 0v-3h-3a.5.5 0 0 1 0-1h3v-3A.5.5 0 0 1 8 4"/>
-                    </svg>
-                </div>
-                <div class="logo-text">HealthAssist</div>
-            </div>
-            <div class="header-controls">
-                <div id="speech-status" class="listening-indicator">
-                    <span class="pulse-dot"></span>
-                    Listening...
-                </div>
-                <button class="header-button" title="Settings">
-                    <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" viewBox="0 0 16 16">
-                        <path d="M8 4.754a3.246 3.246 0 1 0 0 6.492 3.246 3.246 0 0 0 0-6.492zM5.754 8a2.246 2.246 0 1 1 4.492 0 2.246 2.246 0 0 1-4.492 0z"/>
-                        <path d="M9.796 1.343c-.527-1.79-3.065-1.79-3.592 0l-.094.319a.873.873 0 0 1-1.255.52l-.292-.16c-1.64-.892-3.433.902-2.54 2.541l.159.292a.873.873 0 0 1-.52 1.255l-.319.094c-1.79.527-1.79 3.065 0 3.592l.319.094a.873.873 0 0 1 .52 1.255l-.16.292c-.892 1.64.901 3.434 2.541 2.54l.292-.159a.873.873 0 0 1 1.255.52l.094.319c.527 1.79 3.065 1.79 3.592 0l.094-.319a.873.873 0 0 1 1.255-.52l.292.16c1.64.893 3.434-.902 2.54-2.541l-.159-.292a.873.873 0 0 1 .52-1.255l.319-.094c1.79-.527 1.79-3.065 0-3.592l-.319-.094a.873.873 0 0 1-.52-1.255l.16-.292c.893-1.64-.902-3.433-2.541-2.54l-.292.159a.873.873 0 0 1-1.255-.52l-.094-.319zm-2.633.283c.246-.835 1.428-.835 1.674 0l.094.319a1.873 1.873 0 0 0 2.693 1.115l.291-.16c.764-.415 1.6.42 1.184 1.185l-.159.292a1.873 1.873 0 0 0 1.116 2.692l.318.094c.835.246.835 1.428 0 1.674l-.319.094a1.873 1.873 0 0 0-1.115 2.693l.16.291c.415.764-.42 1.6-1.185 1.184l-.291-.159a1.873 1.873 0 0 0-2.693 1.116l-.094.318c-.246.835-1.428.835-1.674 0l-.094-.319a1.873 1.873 0 0 0-2.692-1.115l-.292.16c-.764.415-1.6-.42-1.184-1.185l.159-.291A1.873 1.873 0 0 0 1.945 8.93l-.319-.094c-.835-.246-.835-1.428 0-1.674l.319-.094A1.873 1.873 0 0 0 3.06 4.377l-.16-.292c-.415-.764.42-1.6 1.185-1.184l.292.159a1.873 1.873 0 0 0 2.692-1.115l.094-.319z"/>
-                    </svg>
-                </button>
-                <button class="header-button" title="Help">
-                    <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" viewBox="0 0 16 16">
-                        <path d="M8 15A7 7 0 1 1 8 1a7 7 0 0 1 0 14zm0 1A8 8 0 1 0 8 0a8 8 0 0 0 0 16z"/>
-                        <path d="M5.255 5.786a.237.237 0 0 0 .241.247h.825c.138 0 .248-.113.266-.25.09-.656.54-1.134 1.342-1.134.686 0 1.314.343 1.314 1.168 0 .635-.374.927-.965 1.371-.673.489-1.206 1.06-1.168 1.987l.003.217a.25.25 0 0 0 .25.246h.811a.25.25 0 0 0 .25-.25v-.105c0-.718.273-.927 1.01-1.486.609-.463 1.244-.977 1.244-2.056 0-1.511-1.276-2.241-2.673-2.241-1.267 0-2.655.59-2.75 2.286zm1.557 5.763c0 .533.425.927 1.01.927.609 0 1.028-.394 1.028-.927 0-.552-.42-.94-1.029-.94-.584 0-1.009.388-1.009.94z"/>
-                    </svg>
-                </button>
-            </div>
-        </div>
-        <div class="chat-body" id="chatBody">
-            <div class="welcome-container" id="welcomeContainer">
-                <div class="welcome-logo">
-                    <svg xmlns="http://www.w3.org/2000/svg" width="42" height="42" fill="currentColor" viewBox="0 0 16 16">
-                        <path d="M8 4a.5.5 0 0 1 .5.5v3h3a.5.5 0 0 1 0 1h-3v3a.5.5 0 0 1-1 0v-3h-3a.5.5 0 0 1 0-1h3v-3A.5.5 0 0 1 8 4"/>
-                    </svg>
-                </div>
-                <h1 class="welcome-title">Hello, I'm HealthAssist</h1>
-                <p class="welcome-subtitle">Your trusted AI health companion. I can help answer your health questions, provide information about symptoms, medications, and wellness topics.</p>
-                
-                <div class="capability-chips">
-                    
-                    <div class="chip">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="#0088ff" viewBox="0 0 16 16">
-                            <path d="m8 2.748-.717-.737C5.6.281 2.514.878 1.4 3.053c-.523 1.023-.641 2.5.314 4.385.92 1.815 2.834 3.989 6.286 6.357 3.452-2.368 5.365-4.542 6.286-6.357.955-1.886.838-3.362.314-4.385C13.486.878 10.4.28 8.717 2.01L8 2.748zM8 15C-7.333 4.868 3.279-3.04 7.824 1.143c.06.055.119.112.176.171a3.12 3.12 0 0 1 .176-.17C12.72-3.042 23.333 4.867 8 15z"/>
-                        </svg>
-                        Ask about symptoms
-                    </div>
-                    
-                    <div class="chip">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="#0088ff" viewBox="0 0 16 16">
-                            <path d="M11 2a3 3 0 0 1 3 3v6a3 3 0 0 1-3 3H5a3 3 0 0 1-3-3V5a3 3 0 0 1 3-3h6zM5 1a4 4 0 0 0-4 4v6a4 4 0 0 0 4 4h6a4 4 0 0 0 4-4V5a4 4 0 0 0-4-4H5z"/>
-                            <path d="M8 4a.5.5 0 0 1 .5.5v3h3a.5.5 0 0 1 0 1h-3v3a.5.5 0 0 1-1 0v-3h-3a.5.5 0 0 1 0-1h3v-3A.5.5 0 0 1 8 4z"/>
-                        </svg>
-                        Nutrition advice
-                    </div>
-                    <div class="chip">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16
-                        " fill="#0088ff" viewBox="0 0 16 16">
-                            <path d="M8 9.783v2.734l-.088-.047c-.437.289-.477.373-.77.25-.324-.14-.227-.432-.073-.615.49-.401-.204-1.003-1.132-1.256-.928-.253-1.382-.829-.818-1.256.564-.426 2.036-.194 2.254.272.218.466.35.53.638.7.288.17.457-.018.485-.168s.037-.286-.037-.376c-.073-.09-.164-.234-.54-.234-.376 0-.613.238-.927.882L7 10.134l-.021-.339A1.298 1.298 0 0 0 6.5 8.5c0-.497.183-.966.513-1.324a1.773 1.773 0 0 1 1.287-.662c.773 0 1.356.32 1.764.863.568.759.514 1.595.408 2.126-.396 2.014-1.357 2.235-1.972 2.543-.206.103-.738.485-.79.709-.051.224.019.495.14.557.126.062.482-.07.696-.154.337-.131.774-.272 1.656-.797l.797.483c.532-.32 1.02-.683 1.324-1.109 1.324-1.853.884-5.27-1.15-4.628-.713.228-1.25.78-1.653 1.28h.001Z"/>
-                            <path d="M16 8A8 8 0 1 1 0 8a8 8 0 0 1 16 0ZM1 8a7 7 0 1 0 14 0A7 7 0 0 0 1 8Z"/>
-                        </svg>
-                        Exercise recommendations
-                    </div>
-                </div>
-            </div>
-            
-            <!-- Chat messages will appear here -->
-        </div>
-        
-        <div class="footer">
-            <div class="input-container">
-                <textarea class="message-input" placeholder="Ask HealthAssist about your health concerns..." rows="1" id="messageInput"></textarea>
-                <div class="button-container">
-                    <button class="action-button" title="Attach files">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" fill="currentColor" viewBox="0 0 16 16">
-                            <path d="M4.5 3a2.5 2.5 0 0 1 5 0v9a1.5 1.5 0 0 1-3 0V5a.5.5 0 0 1 1 0v7a.5.5 0 0 0 1 0V3a1.5 1.5 0 1 0-3 0v9a2.5 2.5 0 0 0 5 0V5a.5.5 0 0 1 1 0v7a3.5 3.5 0 1 1-7 0V3z"/>
-                        </svg>
-                    </button>
-                    <button class="action-button voice-button" id="voiceButton" title="Voice input">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" fill="currentColor" viewBox="0 0 16 16">
-                            <path d="M3.5 6.5A.5.5 0 0 1 4 7v1a4 4 0 0 0 8 0V7a.5.5 0 0 1 1 0v1a5 5 0 0 1-4.5 4.975V15h3a.5.5 0 0 1 0 1h-7a.5.5 0 0 1 0-1h3v-2.025A5 5 0 0 1 3 8V7a.5.5 0 0 1 .5-.5z"/>
-                            <path d="M10 8a2 2 0 1 1-4 0V3a2 2 0 1 1 4 0v5z"/>
-                        </svg>
-                    </button>
-                    <button class="action-button send-button" id="sendButton" title="Send message">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" fill="currentColor" viewBox="0 0 16 16">
-                            <path d="M15.964.686a.5.5 0 0 0-.65-.65L.767 5.855H.766l-.452.18a.5.5 0 0 0-.082.887l.41.26.001.002 4.995 3.178 3.178 4.995.002.002.26.41a.5.5 0 0 0 .886-.083l6-15Zm-1.833 1.89L6.637 10.07l-.215-.338a.5.5 0 0 0-.154-.154l-.338-.215 7.494-7.494 1.178-.471-.47 1.178Z"/>
-                        </svg>
-                    </button>
-                </div>
-            </div>
-        </div>
-    </div>
-    
-    <!-- Bootstrap Bundle with Popper -->
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.3.0/js/bootstrap.bundle.min.js"></script>
-    
-    <script>
-        // Store chat history
-        let chatHistory = [];
-        
-        // Auto-resize textarea
-        const textarea = document.getElementById('messageInput');
-        textarea.addEventListener('input', function() {
-            this.style.height = 'auto';
-            this.style.height = (this.scrollHeight < 200) ? this.scrollHeight + 'px' : '200px';
-        });
-        
-        // Get current time for messages
-        function getCurrentTime() {
-            const now = new Date();
-            return now.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-        }
-        
-        // Send message to backend API
-        async function sendMessageToAPI(message) {
-            try {
-                const response = await fetch('/api/chat', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        message: message,
-                        history: chatHistory
-                    }),
-                });
-                
-                const data = await response.json();
-                return data.response;
-            } catch (error) {
-                console.error('Error sending message to API:', error);
-                return "I'm sorry, I encountered an error. Please try again later.";
-            }
-        }
-        
-        // Send message function
-        const sendButton = document.getElementById('sendButton');
-        const chatBody = document.getElementById('chatBody');
-        const welcomeContainer = document.getElementById('welcomeContainer');
-        
-        async function sendMessage() {
-            const message = textarea.value.trim();
-            if (message) {
-                // Hide welcome container when chat starts
-                if (welcomeContainer && welcomeContainer.style.display !== 'none') {
-                    welcomeContainer.style.display = 'none';
-                }
-                
-                // Add user message
-                const userContainer = document.createElement('div');
-                userContainer.className = 'message-container user-container';
-                
-                const userMessageDiv = document.createElement('div');
-                userMessageDiv.className = 'message user-message';
-                userMessageDiv.textContent = message;
-                
-                const userTimeDiv = document.createElement('div');
-                userTimeDiv.className = 'message-time';
-                userTimeDiv.textContent = getCurrentTime();
-                
-                userContainer.appendChild(userMessageDiv);
-                userContainer.appendChild(userTimeDiv);
-                chatBody.appendChild(userContainer);
-                
-                // Update chat history
-                chatHistory.push({ role: "user", content: message });
-                
-                // Clear input
-                textarea.value = '';
-                textarea.style.height = 'auto';
-                
-                // Scroll to bottom
-                chatBody.scrollTop = chatBody.scrollHeight;
-                
-                // Create and show typing indicator
-                const botContainer = document.createElement('div');
-                botContainer.className = 'message-container bot-container';
-                
-                const typingIndicator = document.createElement('div');
-                typingIndicator.className = 'typing-indicator';
-                typingIndicator.innerHTML = `
-                    <div class="typing-dot"></div>
-                    <div class="typing-dot"></div>
-                    <div class="typing-dot"></div>
-                `;
-                
-                botContainer.appendChild(typingIndicator);
-                chatBody.appendChild(botContainer);
-                chatBody.scrollTop = chatBody.scrollHeight;
-                
-                // Get response from API
-                const botResponse = await sendMessageToAPI(message);
-                
-                // Update chat history
-                chatHistory.push({ role: "assistant", content: botResponse });
-                
-                // Remove typing indicator
-                chatBody.removeChild(botContainer);
-                
-                // Add bot message
-                const newBotContainer = document.createElement('div');
-                newBotContainer.className = 'message-container bot-container';
-                
-                const botMessageDiv = document.createElement('div');
-                botMessageDiv.className = 'message bot-message';
-                
-                const botMessageHeader = document.createElement('div');
-                botMessageHeader.className = 'bot-message-header';
-                
-                const botIcon = document.createElement('div');
-                botIcon.className = 'bot-icon';
-                botIcon.innerHTML = '<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" viewBox="0 0 16 16"><path d="M8 4a.5.5 0 0 1 .5.5v3h3a.5.5 0 0 1 0 1h-3v3a.5.5 0 0 1-1 0v-3h-3a.5.5 0 0 1 0-1h3v-3A.5.5 0 0 1 8 4"/></svg>';
-                
-                botMessageHeader.appendChild(botIcon);
-                botMessageDiv.appendChild(botMessageHeader);
-                
-                const botResponseDiv = document.createElement('div');
-                botResponseDiv.textContent = botResponse;
-                botMessageDiv.appendChild(botResponseDiv);
-                
-                const botTimeDiv = document.createElement('div');
-                botTimeDiv.className = 'message-time';
-                botTimeDiv.textContent = getCurrentTime();
-                
-                newBotContainer.appendChild(botMessageDiv);
-                newBotContainer.appendChild(botTimeDiv);
-                chatBody.appendChild(newBotContainer);
-                chatBody.scrollTop = chatBody.scrollHeight;
-            }
-        }
-        
-        sendButton.addEventListener('click', sendMessage);
-        
-        // Voice input functionality
-        const voiceButton = document.getElementById('voiceButton');
-        const speechStatus = document.getElementById('speech-status');
-        let recognition;
-        
-        // Check if browser supports speech recognition
-        if ('webkitSpeechRecognition' in window || 'SpeechRecognition' in window) {
-            // Create speech recognition object
-            recognition = new (window.SpeechRecognition || window.webkitSpeechRecognition)();
-            recognition.continuous = false;
-            recognition.interimResults = true;
-            
-            // Configure speech recognition
-            recognition.lang = 'en-US';
-            
-            // Handle results
-            recognition.onresult = function(event) {
-                const transcript = Array.from(event.results)
-                    .map(result => result[0])
-                    .map(result => result.transcript)
-                    .join('');
-                
-                textarea.value = transcript;
-                textarea.dispatchEvent(new Event('input'));
-            };
-            
-            // Handle end of speech
-            recognition.onend = function() {
-                voiceButton.classList.remove('listening');
-                speechStatus.style.visibility = 'hidden';
-                
-                // If we got text, automatically send the message
-                if (textarea.value.trim()) {
-                    setTimeout(() => sendMessage(), 500);
-                }
-            };
-            
-            // Handle errors
-            recognition.onerror = function(event) {
-                console.error('Speech recognition error', event.error);
-                voiceButton.classList.remove('listening');
-                speechStatus.style.visibility = 'hidden';
-            };
-            
-            // Set up voice button
-            voiceButton.addEventListener('click', function() {
-                if (voiceButton.classList.contains('listening')) {
-                    // Stop listening
-                    recognition.stop();
-                    voiceButton.classList.remove('listening');
-                    speechStatus.style.visibility = 'hidden';
-                } else {
-                    // Start listening
-                    recognition.start();
-                    voiceButton.classList.add('listening');
-                    speechStatus.style.visibility = 'visible';
-                    
-                    // Cancel if no speech detected after 5 seconds
-                    setTimeout(() => {
-                        if (voiceButton.classList.contains('listening') && !textarea.value.trim()) {
-                            recognition.stop();
-                        }
-                    }, 5000);
-                }
-            });
-        } else {
-            // Browser doesn't support speech recognition
-            voiceButton.addEventListener('click', function() {
-                alert('Your browser does not support speech recognition. Please try using Chrome or Edge.');
-            });
-        }
-        
-        // Send message on Enter (but Shift+Enter for new line)
-        textarea.addEventListener('keydown', function(event) {
-            if (event.key === 'Enter' && !event.shiftKey) {
-                event.preventDefault();
-                sendButton.click();
-            }
-        });
-        
-        // Handle example chips
-        const chips = document.querySelectorAll('.chip');
-        chips.forEach(chip => {
-            chip.addEventListener('click', function() {
-                textarea.value = this.textContent.trim();
-                textarea.dispatchEvent(new Event('input'));
-                textarea.focus();
-                
-                // After a short delay, send the message
-                setTimeout(() => sendButton.click(), 300);
-            });
-        });
-    </script>
-</body>
-</html>"""
+from api.deadline import Deadline, DeadlineExceeded, RequestCancelled
 
-import os
-import json
-import urllib.request
-import urllib.error
+try:
+    from flask_sock import Sock
+except ImportError:  # WebSocket support is optional (not available on Vercel)
+    Sock = None
+
+app = Flask(__name__)
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "templates", "index.html")
 
 # Initialize OpenAI API key with fallback
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+OPENAI_API_HOST = os.environ.get("OPENAI_API_HOST", "api.openai.com")
+# Plain HTTP is only for local stubs such as the traffic replay tool
+OPENAI_API_TLS = os.environ.get("OPENAI_API_TLS", "1") != "0"
+OPENAI_CHAT_PATH = "/v1/chat/completions"
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4")
 
-def get_openai_response(prompt, history):
-    """Custom function to get OpenAI response using direct HTTP request"""
-    try:
-        # Prepare the data to send to OpenAI API
-        messages = history + [{"role": "user", "content": prompt}]
-        
-        data = {
-            "model": "gpt-4",
-            "messages": messages
-        }
+# The platform kills a function at its maximum duration (on Vercel, the
+# project's Functions > Max Duration setting), so FUNCTION_MAX_DURATION_SECONDS
+# must be set to match it. A chat turn gets that limit minus a margin for the
+# response to leave the function, and never more; the reserve is held back
+# within it to build and send a degraded answer.
+FUNCTION_MAX_DURATION_SECONDS = float(os.environ.get("FUNCTION_MAX_DURATION_SECONDS", "30"))
+CHAT_DEADLINE_SECONDS = min(
+    float(os.environ.get("CHAT_DEADLINE_SECONDS", FUNCTION_MAX_DURATION_SECONDS - 5)),
+    FUNCTION_MAX_DURATION_SECONDS - 1,
+)
+CHAT_DEADLINE_RESERVE_SECONDS = float(os.environ.get("CHAT_DEADLINE_RESERVE_SECONDS", "1"))
+UPSTREAM_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", "1"))
+UPSTREAM_RETRY_BACKOFF = float(os.environ.get("UPSTREAM_RETRY_BACKOFF", "0.5"))
+UPSTREAM_MIN_ATTEMPT_SECONDS = float(os.environ.get("UPSTREAM_MIN_ATTEMPT_SECONDS", "3"))
 
-        # Convert data to JSON
-        json_data = json.dumps(data).encode('utf-8')
-        
-        # Set up the request
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAI_API_KEY}"
-        }
-        
-        # Create the request
-        req = urllib.request.Request(
-            "https://api.openai.com/v1/chat/completions",
-            data=json_data,
-            headers=headers,
-            method="POST"
+# Curated FAQ answered locally before falling back to the upstream model
+KB_PATH = os.environ.get("KB_PATH", os.path.join(os.path.dirname(__file__), "data", "health_faq.json"))
+KB_ANSWER_THRESHOLD = float(os.environ.get("KB_ANSWER_THRESHOLD", "0.75"))
+KB_INJECT_PASSAGES = int(os.environ.get("KB_INJECT_PASSAGES", "0"))
+KB_INJECT_THRESHOLD = float(os.environ.get("KB_INJECT_THRESHOLD", "0.3"))
+
+# Emergency phrases answered immediately with a templated urgent-care response
+TRIAGE_LEXICON_PATH = os.environ.get("TRIAGE_LEXICON_PATH", os.path.join(os.path.dirname(__file__), "data", "triage_lexicon.json"))
+
+# Shared state: per-process memory by default, or a SQLite file that every
+# worker of a multi-process server uses (see gunicorn.conf.py)
+SHARED_STORE_PATH = os.environ.get("SHARED_STORE_PATH", "")
+STORE_MAX_ENTRIES = int(os.environ.get("STORE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "600"))
+RATE_LIMIT_PER_MINUTE = int(os.environ.get("RATE_LIMIT_PER_MINUTE", "60"))
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(24 * 3600)))
+
+# Proxies in front of the app whose X-Forwarded-For entries are believed when
+# identifying clients: Vercel's edge, or none when gunicorn is exposed directly
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "1" if os.environ.get("VERCEL") else "0"))
+
+# Daily token quotas (0 = unlimited); past USAGE_DOWNGRADE_AT of a quota
+# requests are served by the cheaper OPENAI_DOWNGRADE_MODEL
+USAGE_CLIENT_DAILY_TOKENS = int(os.environ.get("USAGE_CLIENT_DAILY_TOKENS", "0"))
+USAGE_SESSION_DAILY_TOKENS = int(os.environ.get("USAGE_SESSION_DAILY_TOKENS", "0"))
+USAGE_DOWNGRADE_AT = float(os.environ.get("USAGE_DOWNGRADE_AT", "0.8"))
+USAGE_FLUSH_SECONDS = float(os.environ.get("USAGE_FLUSH_SECONDS", "10"))
+OPENAI_DOWNGRADE_MODEL = os.environ.get("OPENAI_DOWNGRADE_MODEL", "gpt-3.5-turbo")
+
+# Token guarding the admin endpoints and the X-Profile request header
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# On-demand profiling of live chat requests
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/healthassist-profiles")
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sample")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+
+# Audit trail of prompts and responses, written off the request path
+CHAT_LOG_DIR = os.environ.get("CHAT_LOG_DIR", "")
+CHAT_LOG_QUEUE = int(os.environ.get("CHAT_LOG_QUEUE", "10000"))
+CHAT_LOG_MAX_BYTES = int(os.environ.get("CHAT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+CHAT_LOG_ROTATE_SECONDS = int(os.environ.get("CHAT_LOG_ROTATE_SECONDS", "3600"))
+CHAT_LOG_OVERFLOW = os.environ.get("CHAT_LOG_OVERFLOW", "sample")
+
+# Anonymized traffic shapes for benchmarks/replay_capture.py (off unless CAPTURE_DIR is set)
+CAPTURE_DIR = os.environ.get("CAPTURE_DIR", "")
+CAPTURE_SAMPLE_RATE = float(os.environ.get("CAPTURE_SAMPLE_RATE", "1"))
+CAPTURE_SALT = os.environ.get("CAPTURE_SALT", "")
+
+# WebSocket chat channel: pages ping every heartbeat and are dropped after two silent ones.
+# Each open channel holds a server thread, so a process admits at most
+# WS_MAX_CHANNELS (0 = unlimited; gunicorn.conf.py keeps it to half the
+# worker's threads) and further pages are refused the upgrade and use HTTP.
+WS_HEARTBEAT_SECONDS = float(os.environ.get("WS_HEARTBEAT_SECONDS", "25"))
+WS_MAX_IN_FLIGHT = int(os.environ.get("WS_MAX_IN_FLIGHT", "4"))
+WS_MAX_CHANNELS = int(os.environ.get("WS_MAX_CHANNELS", "0"))
+
+# Older turns are folded into a running summary once the raw history passes
+# SUMMARY_AFTER_TURNS (0 disables); the last SUMMARY_KEEP_TURNS stay verbatim
+SUMMARY_AFTER_TURNS = int(os.environ.get("SUMMARY_AFTER_TURNS", "12"))
+SUMMARY_KEEP_TURNS = int(os.environ.get("SUMMARY_KEEP_TURNS", "6"))
+SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL", OPENAI_DOWNGRADE_MODEL)
+SUMMARY_DEADLINE_SECONDS = float(os.environ.get("SUMMARY_DEADLINE_SECONDS", "60"))
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a health consultation between a user and HealthAssist. "
+    "Extend the existing summary with the new turns. Keep symptoms, durations, medications, "
+    "conditions, advice already given and open questions; drop pleasantries. "
+    "Reply with the updated summary only, in at most 200 words."
+)
+
+# Results of chat requests sent with an Idempotency-Key are kept this long
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", "600"))
+
+# Suggested follow-up questions after model answers (FOLLOWUP_COUNT=0 disables);
+# the first FOLLOWUP_PRECOMPUTE (off by default: each one is an OPENAI_MODEL
+# call) are answered ahead of time. Both spend FOLLOWUP_DAILY_TOKENS
+# (0 = unlimited) across all workers, never the user's own quota. Like jobs,
+# they are prepared after the response is sent and fetched through any
+# worker, so they need a long-running server sharing SHARED_STORE_PATH.
+FOLLOWUP_COUNT = int(os.environ.get("FOLLOWUP_COUNT", "3"))
+FOLLOWUPS_ENABLED = bool(SHARED_STORE_PATH) and FOLLOWUP_COUNT > 0
+FOLLOWUP_PRECOMPUTE = int(os.environ.get("FOLLOWUP_PRECOMPUTE", "0"))
+FOLLOWUP_DAILY_TOKENS = int(os.environ.get("FOLLOWUP_DAILY_TOKENS", "200000"))
+FOLLOWUP_MODEL = os.environ.get("FOLLOWUP_MODEL", OPENAI_DOWNGRADE_MODEL)
+FOLLOWUP_DEADLINE_SECONDS = float(os.environ.get("FOLLOWUP_DEADLINE_SECONDS", "60"))
+FOLLOWUP_TTL = int(os.environ.get("FOLLOWUP_TTL", "900"))
+FOLLOWUP_PROMPT = (
+    "Suggest the {count} follow-up questions the user is most likely to ask HealthAssist next, "
+    "phrased as the user would type them. Reply with one question per line, without numbering."
+)
+
+# Real-user timings beaconed by the page to /api/rum
+RUM_FLUSH_SECONDS = float(os.environ.get("RUM_FLUSH_SECONDS", "10"))
+RUM_MAX_BEACON_BYTES = int(os.environ.get("RUM_MAX_BEACON_BYTES", "65536"))
+
+# Background jobs for answers that may outlive a request: their own, longer
+# deadline, a bounded queue per process and results kept for JOB_TTL seconds.
+# Jobs outlive the request that submits them and are polled through any
+# worker, so they need a long-running server sharing SHARED_STORE_PATH; on
+# Vercel the job routes answer 404 and the page stays on /api/chat.
+JOBS_ENABLED = bool(SHARED_STORE_PATH)
+JOB_DEADLINE_SECONDS = float(os.environ.get("JOB_DEADLINE_SECONDS", "120"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", "100"))
+JOB_TTL = int(os.environ.get("JOB_TTL", "600"))
+JOB_LONG_POLL_SECONDS = float(os.environ.get("JOB_LONG_POLL_SECONDS", "20"))
+
+if TRUSTED_PROXY_COUNT:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+def once(factory):
+    """Memoize a builder per argument tuple, safe under concurrent first use"""
+    results = {}
+    lock = threading.RLock()
+
+    @wraps(factory)
+    def wrapper(*args):
+        try:
+            return results[args]
+        except KeyError:
+            pass
+        with lock:
+            if args not in results:
+                results[args] = factory(*args)
+            return results[args]
+    return wrapper
+
+@once
+def page_variant(encoding):
+    """Homepage bytes, optionally gzip-compressed, built once per instance"""
+    if encoding == "gzip":
+        import gzip
+        return gzip.compress(page_variant("identity"), compresslevel=9)
+    with open(TEMPLATE_PATH, "rb") as f:
+        return f.read()
+
+@once
+def get_knowledge_base():
+    """Build the FAQ index on first use"""
+    from api.knowledge import KnowledgeBase
+    return KnowledgeBase.load(KB_PATH)
+
+@once
+def get_triage():
+    """Compile the triage phrase automaton on first use"""
+    from api.triage import TriageClassifier
+    return TriageClassifier.load(TRIAGE_LEXICON_PATH)
+
+@once
+def get_store():
+    """Shared key/value store for caches, sessions and rate limits"""
+    from api.store import MemoryStore, SQLiteStore
+    if SHARED_STORE_PATH:
+        return SQLiteStore(SHARED_STORE_PATH)
+    # Quota counters must survive cache churn, or quotas silently reset; RUM
+    # sketches and speculation totals are kept apart (their key count is
+    # bounded) so beacons cannot push other entries out
+    return MemoryStore(STORE_MAX_ENTRIES, pinned=("usage", "rum", "speculation-stats"))
+
+@once
+def get_speculations():
+    """Speculative requests the client may still withdraw, through any worker"""
+    from api.speculation import SpeculationRegistry
+    return SpeculationRegistry(get_store())
+
+@once
+def get_usage():
+    """Token usage tracker, flushing into the shared store"""
+    import atexit
+    from api.usage import UsageTracker
+    usage = UsageTracker(get_store(), flush_interval=USAGE_FLUSH_SECONDS)
+    atexit.register(usage.flush)
+    return usage
+
+@once
+def get_jobs():
+    """Queue of background chat jobs, sharing their state through the store"""
+    from api.jobs import JobQueue
+
+    def run(payload, deadline):
+        return answer_turn(payload["message"], payload["history"], deadline, tuple(payload["account"]))
+
+    return JobQueue(get_store(), run, budget=JOB_DEADLINE_SECONDS, workers=JOB_WORKERS,
+                    max_pending=JOB_MAX_PENDING, ttl=JOB_TTL)
+
+@once
+def get_summarizer():
+    """Running per-conversation summaries, folded on a background thread"""
+    if not SUMMARY_AFTER_TURNS:
+        return None
+    from api.summary import ConversationSummarizer
+    return ConversationSummarizer(get_store(), summarize_turns, threshold=SUMMARY_AFTER_TURNS,
+                                  keep=SUMMARY_KEEP_TURNS, ttl=SESSION_TTL)
+
+@once
+def get_idempotency():
+    """At-most-once execution of chat requests carrying an Idempotency-Key"""
+    from api.idempotency import IdempotencyKeys
+    return IdempotencyKeys(get_store(), ttl=IDEMPOTENCY_TTL)
+
+@once
+def get_followups():
+    """Follow-up suggestions and their precomputed answers"""
+    if not FOLLOWUPS_ENABLED:
+        return None
+    from api.followups import FollowUps
+    return FollowUps(get_store(), suggest_followups, precompute_followup, count=FOLLOWUP_COUNT,
+                     precompute_count=FOLLOWUP_PRECOMPUTE, daily_tokens=FOLLOWUP_DAILY_TOKENS,
+                     ttl=FOLLOWUP_TTL)
+
+@once
+def get_rum():
+    """Percentile sketches of real-user timings, flushing into the shared store"""
+    import atexit
+    from api.rum import RumAggregator
+    rum = RumAggregator(get_store(), flush_interval=RUM_FLUSH_SECONDS)
+    atexit.register(rum.flush)
+    return rum
+
+@once
+def get_profiler():
+    """Profiler for sampled or explicitly requested chat turns"""
+    from api.profiling import Profiler
+    return Profiler(PROFILE_DIR, mode=PROFILE_MODE, sample_rate=PROFILE_SAMPLE_RATE)
+
+def warm_up():
+    """Build the lazily constructed pieces ahead of traffic
+
+    Called by gunicorn in the master before forking, so workers share the
+    indexes copy-on-write instead of each building them on first request.
+    """
+    get_knowledge_base()
+    get_triage()
+    page_variant("gzip")
+
+@once
+def get_chat_log():
+    """Start the conversation logger on first use, if configured"""
+    if not CHAT_LOG_DIR:
+        return None
+    import atexit
+    from api.chatlog import ConversationLogger
+    chat_log = ConversationLogger(
+        CHAT_LOG_DIR,
+        max_queue=CHAT_LOG_QUEUE,
+        max_file_bytes=CHAT_LOG_MAX_BYTES,
+        rotate_seconds=CHAT_LOG_ROTATE_SECONDS,
+        overflow=CHAT_LOG_OVERFLOW,
+    )
+    atexit.register(chat_log.close)
+    return chat_log
+
+@once
+def get_capture():
+    """Start the traffic capture on first use, if configured"""
+    if not CAPTURE_DIR:
+        return None
+    import atexit
+    from api.capture import TrafficCapture
+    from api.chatlog import ConversationLogger
+    writer = ConversationLogger(CAPTURE_DIR, max_file_bytes=CHAT_LOG_MAX_BYTES,
+                                rotate_seconds=CHAT_LOG_ROTATE_SECONDS, redactors=[], prefix="capture")
+    atexit.register(writer.close)
+    return TrafficCapture(writer, CAPTURE_SAMPLE_RATE, CAPTURE_SALT or None)
+
+@once
+def upstream_ssl_context():
+    """One SSL context per instance, so CA certificates load only once"""
+    import ssl
+    return ssl.create_default_context()
+
+class UpstreamError(Exception):
+    """Non-success HTTP status from the OpenAI API"""
+
+    def __init__(self, status, body):
+        super().__init__(f"upstream returned HTTP {status}: {body[:200]}")
+        self.status = status
+
+def with_retries(call, deadline):
+    """Run an upstream call, retrying transient failures while budget remains"""
+    import socket
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except UpstreamError as e:
+            if e.status != 429 and e.status < 500:
+                raise
+            error = e
+        except (socket.timeout, ConnectionError) as e:
+            error = e
+        # Retry with backoff only if a useful slice of the budget would be left
+        backoff = UPSTREAM_RETRY_BACKOFF * (2 ** attempt)
+        attempt += 1
+        if attempt > UPSTREAM_RETRIES or deadline.remaining() < backoff + UPSTREAM_MIN_ATTEMPT_SECONDS:
+            raise error
+        time.sleep(backoff)
+
+def post_completion(data, deadline):
+    """POST a chat completion request, bounded by the request deadline
+
+    Connect, send and every read get only the budget that is left, and
+    transient failures are retried while enough of it remains.
+    """
+    import json
+    body = json.dumps(data).encode('utf-8')
+    return json.loads(with_retries(lambda: send_upstream(body, deadline), deadline))
+
+def stream_completion(data, deadline, on_delta):
+    """Streamed variant of post_completion, calling on_delta for each content piece
+
+    Returns a response dict shaped like the non-streamed one. Only failures
+    before the first piece are retried, so no text is ever sent twice.
+    """
+    import json
+    body = json.dumps(dict(data, stream=True, stream_options={"include_usage": True})).encode('utf-8')
+    parts = []
+    usage = {}
+    buffer = [b""]
+
+    def on_chunk(chunk):
+        # Server-sent events: one "data: {...}" line per event
+        lines = (buffer[0] + chunk).split(b"\n")
+        buffer[0] = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b"data:") or line == b"data: [DONE]":
+                continue
+            event = json.loads(line[5:])
+            if event.get("usage"):
+                usage.update(event["usage"])
+            for choice in event.get("choices", []):
+                delta = choice.get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+
+    def call():
+        try:
+            return send_upstream(body, deadline, on_chunk)
+        except (OSError, UpstreamError):
+            if parts:
+                raise RuntimeError("upstream stream interrupted")
+            raise
+
+    with_retries(call, deadline)
+    return {"choices": [{"message": {"content": "".join(parts)}}], "usage": usage}
+
+def send_upstream(body, deadline, on_chunk=None):
+    """Send one request and read the whole response body before the deadline
+
+    With on_chunk, a successful body is handed over piece by piece as it
+    arrives instead of being returned.
+    """
+    import http.client
+    import socket
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {OPENAI_API_KEY}"
+    }
+    if OPENAI_API_TLS:
+        conn = http.client.HTTPSConnection(
+            OPENAI_API_HOST,
+            timeout=deadline.timeout("upstream connect"),
+            context=upstream_ssl_context(),
         )
-        
-        # Make the request
-        with urllib.request.urlopen(req, timeout=30) as response:
-            response_data = json.loads(response.read().decode('utf-8'))
-            return response_data["choices"][0]["message"]["content"]
-            
-    except Exception as e:
-        return f"I apologize, but I'm having trouble connecting to my knowledge service. Error: {str(e)}"
+    else:
+        conn = http.client.HTTPConnection(OPENAI_API_HOST, timeout=deadline.timeout("upstream connect"))
+    started = time.perf_counter()
+    first_byte = None
+    received = 0
+    status = 0
+    try:
+        # A connect, TLS handshake or send that uses up the budget ends the turn
+        # like a slow read does, so the caller can still answer in time
+        try:
+            conn.connect()
+        except socket.timeout:
+            deadline.check("upstream connect")
+            raise DeadlineExceeded("upstream connect")
+        sock = conn.sock
+        # Cancelling the request (e.g. a replaced speculation) unblocks any pending read
+        deadline.on_cancel(lambda: sock.shutdown(socket.SHUT_RDWR))
+        try:
+            sock.settimeout(deadline.timeout("upstream send"))
+            conn.request("POST", OPENAI_CHAT_PATH, body=body, headers=headers)
+        except socket.timeout:
+            deadline.check("upstream send")
+            raise DeadlineExceeded("upstream send")
+        except OSError:
+            deadline.check("upstream send")
+            raise
+
+        # socket timeouts are per operation, so shrink them to what is left each time
+        chunks = []
+        try:
+            sock.settimeout(deadline.timeout("upstream response"))
+            response = conn.getresponse()
+            first_byte = time.perf_counter() - started
+            status = response.status
+            streaming = on_chunk is not None and response.status < 400
+            while not response.isclosed():
+                sock.settimeout(deadline.timeout("upstream read"))
+                # read1 returns after one socket read, so a trickling body cannot stall past the deadline
+                chunk = response.read1(16384)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if streaming:
+                    on_chunk(chunk)
+                else:
+                    chunks.append(chunk)
+        except socket.timeout:
+            deadline.check("upstream read")
+            raise DeadlineExceeded("upstream read")
+        except OSError:
+            deadline.check("upstream read")
+            raise
+        deadline.check("upstream read")
+
+        payload = b"".join(chunks)
+        if response.status >= 400:
+            raise UpstreamError(response.status, payload.decode('utf-8', 'replace'))
+        return payload
+    finally:
+        conn.close()
+        if CAPTURE_DIR:
+            from api.capture import note_upstream
+            elapsed = time.perf_counter() - started
+            note_upstream(len(body), received, elapsed if first_byte is None else first_byte, elapsed, status)
+
+def cached_completion(data, deadline, on_delta=None):
+    """post_completion behind the shared response cache; returns (data, from_cache)
+
+    Identical requests that arrive while one is in flight (in any worker)
+    wait for its result instead of calling the upstream again. With
+    on_delta the upstream answer is streamed; a cached one arrives whole.
+    """
+    def complete():
+        if on_delta:
+            return stream_completion(data, deadline, on_delta)
+        return post_completion(data, deadline)
+
+    if not RESPONSE_CACHE_TTL:
+        return complete(), False
+    import hashlib
+    import json
+    key = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    store = get_store()
+    while True:
+        cached = store.get("responses", key)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached["choices"][0]["message"]["content"])
+            return cached, True
+        if store.add("inflight", key, os.getpid(), ttl=deadline.remaining() + 1):
+            break
+        deadline.check("waiting for duplicate request")
+        time.sleep(0.1)
+    try:
+        response_data = complete()
+        store.set("responses", key, response_data, ttl=RESPONSE_CACHE_TTL)
+        return response_data, False
+    finally:
+        store.delete("inflight", key)
+
+def completion_request(prompt, history, context=None, model=None):
+    """Chat completion payload for a user prompt, its history and reference passages"""
+    messages = history + [{"role": "user", "content": prompt}]
+    if context:
+        reference = "\n\n".join(context)
+        messages = [{
+            "role": "system",
+            "content": "Reference material from the HealthAssist knowledge base:\n\n" + reference,
+        }] + messages
+    
+    return {
+        "model": model or OPENAI_MODEL,
+        "messages": messages
+    }
+
+def reference_context(user_message):
+    """Closest knowledge-base passages to hand the model, if enabled"""
+    if not KB_INJECT_PASSAGES:
+        return None
+    return [m.entry["answer"] for m in get_knowledge_base().search(user_message, KB_INJECT_PASSAGES)
+            if m.confidence >= KB_INJECT_THRESHOLD]
+
+def get_openai_response(prompt, history, context=None, deadline=None, model=None, account=None, on_delta=None):
+    """Custom function to get OpenAI response using direct HTTP request
+
+    account is an optional (client, session) pair the call's token usage is charged to.
+    on_delta, if given, receives the answer piece by piece as it is generated.
+    Upstream failures raise; compose_answer turns them into an error reply.
+    """
+    if deadline is None:
+        deadline = Deadline(CHAT_DEADLINE_SECONDS)
+    # Prepare the data to send to OpenAI API
+    deadline.check("prompt assembly")
+    data = completion_request(prompt, history, context, model)
+
+    # Make the request
+    called = time.perf_counter()
+    response_data, from_cache = cached_completion(data, deadline, on_delta)
+    if account and not from_cache and "usage" in response_data:
+        # A speculation withdrawn meanwhile was never the user's turn; its
+        # spend is counted against the model only
+        client, session = account if not deadline.cancelled else (None, None)
+        get_usage().record(client, session, data["model"], response_data["usage"],
+                           time.perf_counter() - called)
+    if deadline.cancelled:
+        raise RequestCancelled("answer")
+    return response_data["choices"][0]["message"]["content"]
+
+def summarize_turns(previous, turns, account=None):
+    """Extend a conversation summary with more turns (runs off the request path)"""
+    transcript = "\n".join(f"{turn.get('role', 'user')}: {turn.get('content', '')}"
+                           for turn in turns if isinstance(turn, dict))
+    prompt = ("Existing summary:\n" + previous + "\n\n" if previous else "") + "New turns:\n" + transcript
+    data = {
+        "model": SUMMARY_MODEL,
+        "messages": [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": prompt}],
+        "max_tokens": 400,
+    }
+    called = time.perf_counter()
+    response_data = post_completion(data, Deadline(SUMMARY_DEADLINE_SECONDS))
+    if account and "usage" in response_data:
+        get_usage().record(account[0], account[1], SUMMARY_MODEL, response_data["usage"],
+                           time.perf_counter() - called)
+    return response_data["choices"][0]["message"]["content"].strip()
+
+def suggest_followups(conversation, account=None):
+    """Likely next questions for a conversation; returns (questions, usage)
+
+    The spend is counted against the model only; the user did not ask for it.
+    """
+    data = {
+        "model": FOLLOWUP_MODEL,
+        "messages": [{"role": "system", "content": FOLLOWUP_PROMPT.format(count=FOLLOWUP_COUNT)}] + conversation[-4:],
+        "max_tokens": 150,
+    }
+    called = time.perf_counter()
+    response_data = post_completion(data, Deadline(FOLLOWUP_DEADLINE_SECONDS))
+    usage = response_data.get("usage", {})
+    if usage:
+        get_usage().record(None, None, FOLLOWUP_MODEL, usage, time.perf_counter() - called)
+    questions = []
+    for line in response_data["choices"][0]["message"]["content"].splitlines():
+        question = line.strip().lstrip("-*0123456789.) ").strip()
+        if question and len(question) <= 200:
+            questions.append(question)
+    return questions, usage
+
+def precompute_followup(question, conversation, account=None):
+    """Answer a suggested question ahead of time; (body, usage), or None if answered locally anyway
+
+    The user is charged only if the answer is served (see compose_answer).
+    """
+    triage = get_triage().classify(question)
+    if triage.severity == "high":
+        return None
+    if triage.severity != "medium" and get_knowledge_base().answer(question, KB_ANSWER_THRESHOLD):
+        return None
+    summarizer = get_summarizer()
+    prompt_history = summarizer.condense(account[1], conversation) if summarizer and account else conversation
+    data = completion_request(question, prompt_history, reference_context(question))
+    called = time.perf_counter()
+    response_data, from_cache = cached_completion(data, Deadline(FOLLOWUP_DEADLINE_SECONDS))
+    usage = {} if from_cache else response_data.get("usage", {})
+    if usage:
+        get_usage().record(None, None, data["model"], usage, time.perf_counter() - called)
+    body = {"response": response_data["choices"][0]["message"]["content"], "triage": triage.tags}
+    return body, usage
+
+def degraded_answer(user_message):
+    """Best local answer when the deadline runs out before the model replies"""
+    matches = [m for m in get_knowledge_base().search(user_message, 1) if m.confidence >= KB_INJECT_THRESHOLD]
+    if matches:
+        return ("I couldn't finish a complete answer in time, but here is some general "
+                "information that may help:\n\n" + matches[0].entry["answer"])
+    return "I'm sorry, this is taking longer than expected. Please try asking again in a moment."
+
+def request_deadline():
+    """Deadline for the current request, optionally shortened by the client"""
+    budget = CHAT_DEADLINE_SECONDS
+    header = request.headers.get("X-Request-Timeout-Ms")
+    if header:
+        try:
+            budget = min(budget, max(0.0, float(header) / 1000))
+        except ValueError:
+            pass
+    return Deadline(max(0.0, budget - CHAT_DEADLINE_RESERVE_SECONDS))
+
+def is_admin(token=None):
+    """Check a bearer token (or the given token) against ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        return False
+    import hmac
+    if token is None:
+        header = request.headers.get("Authorization", "")
+        token = header[7:] if header.startswith("Bearer ") else ""
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def profiled(view):
+    """Run the view under the profiler when sampled or asked for via X-Profile"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        profiler = get_profiler()
+        forced = "X-Profile" in request.headers and is_admin(request.headers["X-Profile"])
+        if not profiler.wanted(forced):
+            return view(*args, **kwargs)
+        return profiler.run(view, *args, **kwargs)
+    return wrapper
 
 @app.route('/')
 def home():
     """Serve the homepage"""
-    return HTML_TEMPLATE
+    encoding = "gzip" if "gzip" in request.accept_encodings else "identity"
+    response = make_response(page_variant(encoding))
+    response.headers["Content-Type"] = "text/html; charset=utf-8"
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding == "gzip":
+        response.headers["Content-Encoding"] = "gzip"
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint to verify the API is running"""
     return jsonify({"status": "ok"})
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Internal counters for the local subsystems"""
+    return jsonify({
+        "knowledge_base": get_knowledge_base().stats(),
+        "triage": get_triage().stats(),
+        "store": get_store().stats(),
+        "profiling": get_profiler().stats(),
+        "chat_log": get_chat_log().stats() if get_chat_log() else None,
+        "capture": get_capture().stats() if get_capture() else None,
+        "jobs": get_jobs().stats() if JOBS_ENABLED else None,
+        "idempotency": get_idempotency().stats(),
+        "followups": get_followups().stats() if get_followups() else None,
+        "rum": get_rum().summary(),
+        "summaries": get_summarizer().stats() if get_summarizer() else None,
+        "speculation": get_speculations().stats(),
+        "channels": ChatChannel.stats() if Sock else None,
+    })
+
+def client_id():
+    """Address of the caller, as reported by the trusted proxies if there are any"""
+    return request.remote_addr or "unknown"
+
+def session_id():
+    """Per-tab conversation id sent by the page (a query parameter on WebSockets)"""
+    return (request.headers.get("X-Session-Id") or request.args.get("session", ""))[:64]
+
+def rate_limited(client):
+    """Count one message against the client's per-minute budget"""
+    if not RATE_LIMIT_PER_MINUTE:
+        return False
+    window = int(time.time() // 60)
+    count = get_store().incr("ratelimit", f"{client}:{window}", ttl=120)
+    return count > RATE_LIMIT_PER_MINUTE
+
+def touch_session(sid):
+    """Record a turn for a session"""
+    if sid:
+        get_store().incr("sessions", sid, ttl=SESSION_TTL)
+
+def log_turn(user_message, history, response, source, started, triage=None):
+    """Queue an audit record for one chat turn"""
+    chat_log = get_chat_log()
+    if chat_log is None:
+        return
+    chat_log.log({
+        "ts": time.time(),
+        "message": user_message,
+        "response": response,
+        "history_length": len(history),
+        "source": source,
+        "triage": triage.tags if triage else [],
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """Inspect or change profiling for this process; POST {"sample_rate", "mode", "flush"}"""
+    if not is_admin():
+        return jsonify({"error": "unauthorized"}), 401
+    profiler = get_profiler()
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.configure(mode=data.get("mode"), sample_rate=data.get("sample_rate"))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        if data.get("flush"):
+            profiler.flush()
+    return jsonify(profiler.stats())
+
+@app.route('/api/usage', methods=['GET'])
+def usage_summary():
+    """Today's token usage and cost by client, session and model"""
+    if not is_admin():
+        return jsonify({"error": "unauthorized"}), 401
+    top = request.args.get("top", 20, type=int)
+    return jsonify(get_usage().summary(day=request.args.get("day"), top=top))
+
+def answer_turn(user_message, history, deadline, account, on_delta=None):
+    """Answer one chat message; returns (response body, HTTP status)
+
+    Shared by the HTTP endpoint and the WebSocket channel. account is the
+    (client, session) pair; on_delta streams model output as it arrives.
+    """
+    capture = get_capture()
+    if capture is None:
+        return compose_answer(user_message, history, deadline, account, on_delta)
+    return capture.run(lambda: compose_answer(user_message, history, deadline, account, on_delta),
+                       user_message, history, account[1])
+
+def compose_answer(user_message, history, deadline, account, on_delta):
+    """The chat pipeline behind answer_turn"""
+    started = time.perf_counter()
+    if rate_limited(account[0]):
+        return {"response": "You're sending messages too quickly. Please wait a moment and try again."}, 429
+    touch_session(account[1])
+    
+    triage = None
+    streamed = []
+    if on_delta:
+        forward = on_delta
+
+        def on_delta(delta):
+            streamed.append(delta)
+            forward(delta)
+    try:
+        # Emergencies get an immediate, deterministic answer
+        triage = get_triage().classify(user_message)
+        if triage.severity == "high":
+            log_turn(user_message, history, triage.response, "triage", started, triage)
+            return {"response": triage.response, "source": "triage", "triage": triage.tags}, 200
+        
+        # Answer generic questions straight from the knowledge base,
+        # unless the message looks urgent enough to deserve a tailored answer
+        knowledge_base = get_knowledge_base()
+        match = None
+        if triage.severity != "medium":
+            match = knowledge_base.answer(user_message, KB_ANSWER_THRESHOLD)
+        if match:
+            log_turn(user_message, history, match.entry["answer"], "knowledge_base", started, triage)
+            return {"response": match.entry["answer"], "source": "knowledge_base", "triage": triage.tags}, 200
+        
+        # Heavy consumers are turned away or moved to the cheaper model
+        quota = get_usage().check(*account, USAGE_CLIENT_DAILY_TOKENS, USAGE_SESSION_DAILY_TOKENS, USAGE_DOWNGRADE_AT)
+        if quota == "reject":
+            return {"response": "You've reached today's usage limit for HealthAssist. Please try again tomorrow.",
+                    "quota": "exceeded"}, 429
+        model = OPENAI_DOWNGRADE_MODEL if quota == "downgrade" else OPENAI_MODEL
+        
+        # A suggested follow-up may already have been answered in the background
+        # with the full model; only users still within their quota are served it
+        followups = get_followups()
+        precomputed = followups.take(account[1], history, user_message) if followups and quota == "ok" else None
+        if precomputed is not None:
+            answer, usage = precomputed
+            if usage:
+                get_usage().record(account[0], account[1], OPENAI_MODEL, usage, 0.0, count_model=False)
+            log_turn(user_message, history, answer["response"], "precomputed", started, triage)
+            conversation = history + [{"role": "user", "content": user_message},
+                                      {"role": "assistant", "content": answer["response"]}]
+            body = dict(answer, source="precomputed")
+            token = followups.schedule(account[1], conversation, account)
+            if token:
+                body["followups"] = token
+            return body, 200
+        
+        # Otherwise hand the closest passages to the model as reference
+        context = reference_context(user_message)
+        
+        # Long conversations send a running summary in place of their older turns
+        summarizer = get_summarizer()
+        prompt_history = summarizer.condense(account[1], history) if summarizer else history
+        
+        # Get response from OpenAI
+        try:
+            response = get_openai_response(user_message, prompt_history, context, deadline, model, account, on_delta)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            # Flagged so it is neither replayed, summarized nor followed up
+            response = f"I apologize, but I'm having trouble connecting to my knowledge service. Error: {str(e)}"
+            log_turn(user_message, history, response, "error", started, triage)
+            return {"response": response, "error": True, "triage": triage.tags}, 502
+        log_turn(user_message, history, response, "openai", started, triage)
+        conversation = history + [{"role": "user", "content": user_message},
+                                  {"role": "assistant", "content": response}]
+        if summarizer:
+            summarizer.schedule(account[1], conversation, account)
+        body = {"response": response, "triage": triage.tags}
+        token = followups.schedule(account[1], conversation, account) if followups and quota == "ok" else None
+        if token:
+            body["followups"] = token
+        
+        # Return the response
+        return body, 200
+    except RequestCancelled:
+        return {"response": None, "cancelled": True}, 200
+    except DeadlineExceeded:
+        # Answer with what we have rather than being killed by the platform;
+        # a partly streamed answer is kept rather than replaced
+        response = "".join(streamed) or degraded_answer(user_message)
+        log_turn(user_message, history, response, "degraded", started, triage)
+        return {"response": response, "degraded": True}, 200
+
+def idempotent_turn(key, user_message, history, deadline, account, on_delta=None):
+    """answer_turn, at most once per Idempotency-Key; returns (body, status, replayed)
+
+    Keys are scoped to the session (or client), and retries of the same
+    message attach to or replay the first attempt, whichever channel it used.
+    """
+    if not key:
+        return answer_turn(user_message, history, deadline, account, on_delta) + (False,)
+    return get_idempotency().run(
+        f"{account[1] or account[0]}:{key[:128]}", [user_message, history],
+        lambda: answer_turn(user_message, history, deadline, account, on_delta), deadline)
+
 @app.route('/api/chat', methods=['POST'])
+@profiled
 def chat():
     """Chat endpoint"""
+    started = time.perf_counter()
+    deadline = request_deadline()
+    speculation_id = request.headers.get("X-Speculation-Id")
+    if speculation_id:
+        get_speculations().register(speculation_id, deadline)
     try:
         # Parse request data
         data = request.json
         user_message = data.get('message', '')
         history = data.get('history', [])
-        
-        # Get response from OpenAI
-        response = get_openai_response(user_message, history)
-        
-        # Return the response
-        return jsonify({"response": response})
+        key = request.headers.get("Idempotency-Key", "")
+        body, status, replayed = idempotent_turn(key, user_message, history, deadline, (client_id(), session_id()))
+        response = jsonify(body)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        # Lets the page separate network and queueing time from server time
+        response.headers["Server-Timing"] = "app;dur=%.1f" % ((time.perf_counter() - started) * 1000)
+        return response, status
     except Exception as e:
         return jsonify({"response": f"An error occurred: {str(e)}"}), 500
+    finally:
+        if speculation_id:
+            get_speculations().finish(speculation_id)
+
+@app.route('/api/chat/jobs', methods=['POST'])
+def submit_chat_job():
+    """Start a chat turn in the background; poll /api/chat/jobs/<id> for the answer"""
+    if not JOBS_ENABLED:
+        return jsonify({"error": "background jobs are not available on this deployment"}), 404
+    data = request.get_json(silent=True) or {}
+    job_id = get_jobs().submit({
+        "message": str(data.get("message", "")),
+        "history": data.get("history") or [],
+        "account": [client_id(), session_id()],
+    })
+    if job_id is None:
+        return jsonify({"error": "too many jobs queued, please retry shortly"}), 503
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET', 'DELETE'])
+def chat_job(job_id):
+    """Job status, long-polling up to ?wait= seconds for it to finish; DELETE cancels it"""
+    if not JOBS_ENABLED:
+        return jsonify({"error": "background jobs are not available on this deployment"}), 404
+    jobs = get_jobs()
+    if request.method == 'DELETE':
+        return jsonify({"cancelled": jobs.cancel(job_id)})
+    wait = min(max(request.args.get("wait", 0.0, type=float), 0.0), JOB_LONG_POLL_SECONDS)
+    record = jobs.get(job_id, wait)
+    if record is None:
+        return jsonify({"error": "unknown or expired job"}), 404
+    return jsonify(dict(record, job_id=job_id))
+
+@app.route('/api/chat/followups/<token>', methods=['GET'])
+def chat_followups(token):
+    """Suggested follow-ups for an answer, long-polling up to ?wait= seconds"""
+    followups = get_followups()
+    wait = min(max(request.args.get("wait", 0.0, type=float), 0.0), JOB_LONG_POLL_SECONDS)
+    record = followups.questions(token, wait) if followups else None
+    if record is None:
+        return jsonify({"error": "unknown or expired token"}), 404
+    return jsonify(record)
+
+@app.route('/api/rum', methods=['POST'])
+def rum_beacon():
+    """Batched real-user timings from navigator.sendBeacon: {"events": [{"metric", "value"}]}"""
+    if (request.content_length or 0) > RUM_MAX_BEACON_BYTES:
+        return jsonify({"error": "beacon too large"}), 413
+    data = request.get_json(force=True, silent=True) or {}
+    events = data.get("events") if isinstance(data, dict) else None
+    if not isinstance(events, list):
+        return jsonify({"error": "expected an events list"}), 400
+    get_rum().record(events[:500])
+    return "", 204
+
+@app.route('/api/chat/cancel', methods=['POST'])
+def cancel_chat():
+    """Withdraw a speculative request whose transcript changed"""
+    data = request.get_json(silent=True) or {}
+    cancelled = get_speculations().cancel(str(data.get("speculation_id", "")))
+    return jsonify({"cancelled": cancelled})
+
+if Sock is not None:
+    from api.channel import ChatChannel
+    sock = Sock(app)
+
+    @app.before_request
+    def admit_channel():
+        """Refuse the upgrade once this process has no channel slot left"""
+        if request.path == '/api/ws':
+            if not ChatChannel.admit(WS_MAX_CHANNELS):
+                return jsonify({"error": "too many open chat channels, use /api/chat"}), 503
+            g.channel_admitted = True
+
+    @app.teardown_request
+    def release_channel(error=None):
+        if g.pop("channel_admitted", False):
+            ChatChannel.release()
+
+    @sock.route('/api/ws')
+    def chat_socket(ws):
+        """Duplex chat channel; the page falls back to /api/chat without it"""
+        account = (client_id(), session_id())
+
+        def answer(user_message, history, deadline, on_delta, key=None):
+            body, status, _ = idempotent_turn(key, user_message, history, deadline, account, on_delta)
+            return body, status
+
+        budget = max(0.0, CHAT_DEADLINE_SECONDS - CHAT_DEADLINE_RESERVE_SECONDS)
+        ChatChannel(ws, answer, get_speculations(), budget, WS_HEARTBEAT_SECONDS, WS_MAX_IN_FLIGHT).serve()
 
 # This makes the app compatible with Vercel
 app.debug = False
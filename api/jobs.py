@@ -0,0 +1,187 @@
+# File: api/jobs.py
+"""Background chat jobs for answers that may outlive a request's time limit
+
+A job is submitted with its payload and runs on a worker thread of the
+process that accepted it. Its state lives in the shared store under the
+"jobs" namespace, so any worker can answer a poll:
+
+  {"status": "queued" | "running" | "done" | "failed" | "cancelled",
+   "created": unix seconds, "result": response body, "http_status": int}
+
+Records expire after the TTL whatever their state. A job's final state is
+claimed once, with an atomic add under the "job-final" namespace, by either
+its worker or a cancel, so a result and a cancel can never overwrite each
+other. A job cancelled through another worker is noticed by the owning
+process, which polls the claims of its running jobs.
+"""
+import queue
+import secrets
+import threading
+import time
+
+from api.background import BackgroundThreads
+from api.deadline import Deadline
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobQueue:
+    """Bounded queue of chat jobs drained by a small pool of worker threads
+
+    run(payload, deadline) -> (body, status) does the work; each job gets a
+    fresh deadline of `budget` seconds, independent of the submitting request.
+    """
+
+    def __init__(self, store, run, budget=120.0, workers=2, max_pending=100, ttl=600, poll_interval=0.25,
+                 cancel_check_interval=1.0):
+        self.store = store
+        self.run = run
+        self.budget = budget
+        self.workers = workers
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.cancel_check_interval = cancel_check_interval
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._pool = BackgroundThreads(*[(self._work, "chat-job-%d" % i) for i in range(workers)],
+                                       (self._watch, "chat-job-cancels"))
+        self._running = {}
+        self._finished = {}
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def submit(self, payload):
+        """Queue a job; returns its id, or None when the queue is full"""
+        self._pool.ensure_started()
+        job_id = secrets.token_urlsafe(16)
+        self.store.set("jobs", job_id, {"status": "queued", "created": time.time()}, ttl=self.ttl)
+        with self._lock:
+            self._finished[job_id] = threading.Event()
+        try:
+            self._queue.put_nowait((job_id, payload))
+        except queue.Full:
+            self.store.delete("jobs", job_id)
+            self._wake(job_id)
+            self.rejected += 1
+            return None
+        self.submitted += 1
+        return job_id
+
+    def get(self, job_id, wait=0.0):
+        """Current record of a job, waiting up to `wait` seconds for it to finish
+
+        Jobs running in this process wake the waiter directly; others are
+        polled in the store.
+        """
+        record = self._record(job_id)
+        stop = time.monotonic() + wait
+        while record is not None and record["status"] not in FINISHED and time.monotonic() < stop:
+            with self._lock:
+                finished = self._finished.get(job_id)
+            timeout = stop - time.monotonic()
+            if finished is not None:
+                finished.wait(timeout)
+            else:
+                time.sleep(min(self.poll_interval, max(0.0, timeout)))
+            record = self._record(job_id)
+        return record
+
+    def cancel(self, job_id):
+        """Withdraw a job; returns False if it is unknown or already finished"""
+        record = self.store.get("jobs", job_id)
+        if record is None or record["status"] in FINISHED:
+            return False
+        if not self._claim(job_id, "cancelled"):
+            return False
+        self.store.set("jobs", job_id, dict(record, status="cancelled", finished=time.time()), ttl=self.ttl)
+        with self._lock:
+            deadline = self._running.get(job_id)
+        if deadline is not None:
+            deadline.cancel()
+        self.cancelled += 1
+        self._wake(job_id)
+        return True
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "running": len(self._running),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
+
+    def _work(self):
+        while True:
+            job_id, payload = self._queue.get()
+            try:
+                self._execute(job_id, payload)
+            finally:
+                self._queue.task_done()
+
+    def _watch(self):
+        # Cancels made by other workers only reach the store; stop those jobs here
+        while True:
+            time.sleep(self.cancel_check_interval)
+            with self._lock:
+                running = list(self._running.items())
+            for job_id, deadline in running:
+                if self.store.get("job-final", job_id) == "cancelled" or self.store.get("jobs", job_id) is None:
+                    deadline.cancel()
+
+    def _claim(self, job_id, status):
+        """Take the right to write a job's final state; only the first claim wins"""
+        return self.store.add("job-final", job_id, status, ttl=self.ttl)
+
+    def _record(self, job_id):
+        # A cancel can land between a worker reading "queued" and writing
+        # "running"; the claim, not the record, then has the last word
+        record = self.store.get("jobs", job_id)
+        if record is not None and record["status"] not in FINISHED:
+            if self.store.get("job-final", job_id) == "cancelled":
+                record = dict(record, status="cancelled")
+        return record
+
+    def _finish(self, job_id, record, **fields):
+        """Write a job's final state, unless it was cancelled meanwhile; returns False if it was"""
+        if not self._claim(job_id, fields["status"]):
+            return False
+        self.store.set("jobs", job_id, dict(record, finished=time.time(), **fields), ttl=self.ttl)
+        return True
+
+    def _execute(self, job_id, payload):
+        # Registered before the status is read, so a concurrent cancel is never missed
+        deadline = Deadline(self.budget)
+        with self._lock:
+            self._running[job_id] = deadline
+        record = self.store.get("jobs", job_id)
+        if record is None or record["status"] != "queued":
+            with self._lock:
+                self._running.pop(job_id, None)
+            self._wake(job_id)
+            return
+        self.store.set("jobs", job_id, dict(record, status="running", started=time.time()), ttl=self.ttl)
+        try:
+            body, status = self.run(payload, deadline)
+            if self._finish(job_id, record, status="done", result=body, http_status=status):
+                self.completed += 1
+        except Exception as e:
+            if self._finish(job_id, record, status="failed", error=str(e)):
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+            self._wake(job_id)
+
+    def _wake(self, job_id):
+        with self._lock:
+            finished = self._finished.pop(job_id, None)
+        if finished is not None:
+            finished.set()
@@ -0,0 +1,198 @@
+# File: api/knowledge.py
+"""Offline health FAQ knowledge base backed by a compact BM25 inverted index"""
+import json
+import math
+import os
+import re
+from array import array
+
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be been being below between both but by
+can could did do does doing down during each few for from further had has have having he her
+here hers how i if in into is it its itself just me more most much my no nor not now of off on
+once only or other our out over own same she should so some such than that the their them then
+there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours get good best really tell know
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase, drop stopwords and fold simple plurals"""
+    terms = []
+    for word in TOKEN_RE.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class Match:
+    """A scored knowledge base entry"""
+    __slots__ = ("entry", "score", "confidence")
+
+    def __init__(self, entry, score, confidence):
+        self.entry = entry
+        self.score = score
+        self.confidence = confidence
+
+
+class KnowledgeBase:
+    """Curated Q&A entries searchable with BM25
+
+    Postings are stored per term as a pair of arrays (doc ids, term
+    frequencies) so the index stays small for a few thousand entries.
+    """
+
+    def __init__(self, entries, k1=1.5, b=0.75):
+        self.entries = list(entries)
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = array("I")
+        self.question_terms = []
+        self.covered_terms = []
+        postings = {}
+
+        for doc_id, entry in enumerate(self.entries):
+            questions = entry["questions"]
+            # Question phrasings count twice so they outrank incidental answer mentions
+            terms = []
+            for question in questions:
+                terms.extend(tokenize(question) * 2)
+            terms.extend(tokenize(" ".join(entry.get("keywords", []))))
+            terms.extend(tokenize(entry["answer"]))
+            self.doc_lengths.append(len(terms))
+            self.question_terms.append(tuple(frozenset(tokenize(q)) for q in questions))
+            self.covered_terms.append(frozenset(tokenize(" ".join(questions + entry.get("keywords", [])))))
+
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                if term not in postings:
+                    postings[term] = (array("I"), array("H"))
+                docs, tfs = postings[term]
+                docs.append(doc_id)
+                tfs.append(min(tf, 65535))
+
+        count = len(self.entries)
+        self.avg_length = (sum(self.doc_lengths) / count) if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in postings.items()
+        }
+        # A term no entry contains is as specific as a term can be
+        self.unknown_idf = math.log(1 + (count + 0.5) / 0.5)
+        self.postings = postings
+
+    @classmethod
+    def load(cls, path):
+        """Load entries from a JSON or Markdown file, or a directory of them"""
+        if os.path.isdir(path):
+            entries = []
+            for name in sorted(os.listdir(path)):
+                if name.endswith((".json", ".md")):
+                    entries.extend(load_entries(os.path.join(path, name)))
+        else:
+            entries = load_entries(path)
+        return cls(entries)
+
+    def search(self, query, limit=3):
+        """Return the best matches for a query ordered by BM25 score"""
+        terms = set(tokenize(query))
+        scores = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            idf = self.idf[term]
+            docs, tfs = posting
+            for doc_id, tf in zip(docs, tfs):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [Match(self.entries[doc_id], score, self._confidence(terms, doc_id))
+                for doc_id, score in ranked]
+
+    def answer(self, query, threshold):
+        """Return the most confident match if it clears the threshold"""
+        matches = self.search(query)
+        if not matches:
+            return None
+        best = max(matches, key=lambda match: match.confidence)
+        return best if best.confidence >= threshold else None
+
+    def _confidence(self, terms, doc_id):
+        # idf-weighted Dice overlap between the query and the closest question phrasing,
+        # scaled by the share of the query the entry's questions and keywords cover:
+        # a qualifier the entry does not address ("for a newborn", "after a stroke")
+        # changes the question, so it must keep the answer from being served as is
+        weight = {term: self.idf.get(term, self.unknown_idf) for term in terms}
+        query_weight = sum(weight.values())
+        if not query_weight:
+            return 0.0
+        coverage = sum(weight[term] for term in terms & self.covered_terms[doc_id]) / query_weight
+        best = 0.0
+        for question in self.question_terms[doc_id]:
+            question_weight = sum(self.idf.get(term, 0.0) for term in question)
+            shared = sum(weight[term] for term in terms & question)
+            if query_weight + question_weight:
+                best = max(best, 2 * shared / (query_weight + question_weight))
+        return best * coverage
+
+    def stats(self):
+        """Summary of the index size"""
+        return {
+            "entries": len(self.entries),
+            "terms": len(self.postings),
+            "postings": sum(len(docs) for docs, _ in self.postings.values()),
+        }
+
+
+def load_entries(path):
+    """Parse one corpus file into a list of entries"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".md"):
+        return parse_markdown(text)
+
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("entries", [])
+    entries = []
+    for item in data:
+        questions = item.get("questions") or [item["question"]]
+        entries.append({
+            "id": item.get("id", questions[0]),
+            "questions": questions,
+            "answer": item["answer"],
+            "keywords": item.get("keywords", []),
+        })
+    return entries
+
+
+def parse_markdown(text):
+    """Parse '## Question' sections; the section body is the answer"""
+    entries = []
+    question = None
+    body = []
+    for line in text.splitlines() + ["## "]:
+        if line.startswith("## "):
+            if question and "".join(body).strip():
+                entries.append({
+                    "id": question,
+                    "questions": [question],
+                    "answer": "\n".join(body).strip(),
+                    "keywords": [],
+                })
+            question = line[3:].strip()
+            body = []
+        elif question:
+            body.append(line)
+    return entries
@@ -0,0 +1,188 @@
+# File: api/profiling.py
+"""On-demand profiling of live requests into collapsed-stack (flamegraph) files
+
+Two modes:
+  sample   - a background thread snapshots the stacks of profiled request
+             threads every few milliseconds (low overhead, wall-clock view)
+  cprofile - deterministic cProfile of the request (exact call counts,
+             higher overhead); one request at a time
+
+Both aggregate into <directory>/<mode>-<pid>.collapsed, the "frame;frame count"
+format read by flamegraph.pl, speedscope and inferno. cProfile runs also keep
+a merged <directory>/cprofile-<pid>.prof for pstats/snakeviz.
+
+When the sample rate is zero and no request asks for a profile, the only cost
+is one comparison per request.
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+
+def frame_label(code):
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class Profiler:
+    """Profiles a configurable fraction of requests"""
+
+    def __init__(self, directory, mode="sample", sample_rate=0.0, interval=0.005, flush_interval=5.0):
+        self.directory = directory
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()
+        self._active = set()
+        self._wake = threading.Event()
+        self._sampler = None
+        self._stacks = {}
+        self._pstats = None
+        self._last_flush = 0.0
+
+        self.profiled = 0
+        self.samples = 0
+        self.skipped = 0
+
+    def configure(self, mode=None, sample_rate=None):
+        if mode is not None:
+            if mode not in ("sample", "cprofile"):
+                raise ValueError("mode must be 'sample' or 'cprofile'")
+            self.mode = mode
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+
+    def wanted(self, forced=False):
+        """Decide whether the current request is profiled"""
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def run(self, func, *args, **kwargs):
+        """Call func under the configured profiler"""
+        if self.mode == "cprofile":
+            return self._run_cprofile(func, args, kwargs)
+        return self._run_sampled(func, args, kwargs)
+
+    def _run_sampled(self, func, args, kwargs):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active.add(thread_id)
+            self.profiled += 1
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+        self._wake.set()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active.discard(thread_id)
+            self._maybe_flush()
+
+    def _sample_loop(self):
+        stacks = self._stacks
+        while True:
+            # Clear under the lock so a request registering right now cannot be missed
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id in self._active:
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(frame_label(frame.f_code))
+                        frame = frame.f_back
+                    key = ";".join(reversed(labels))
+                    stacks[key] = stacks.get(key, 0) + 1
+                    self.samples += 1
+            time.sleep(self.interval)
+
+    def _run_cprofile(self, func, args, kwargs):
+        # Only one cProfile may be active per process; overlapping requests run unprofiled
+        if not self._cprofile_lock.acquire(blocking=False):
+            self.skipped += 1
+            return func(*args, **kwargs)
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        finally:
+            self._cprofile_lock.release()
+            with self._lock:
+                self.profiled += 1
+                if self._pstats is None:
+                    self._pstats = pstats.Stats(profile)
+                else:
+                    self._pstats.add(profile)
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the aggregated profiles to disk"""
+        self._last_flush = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        pid = os.getpid()
+        with self._lock:
+            stacks = dict(self._stacks)
+            merged = self._pstats
+            if merged is not None:
+                merged.dump_stats(os.path.join(self.directory, "cprofile-%d.prof" % pid))
+                stacks_cprofile = self._collapse_pstats(merged)
+            else:
+                stacks_cprofile = {}
+        for mode, data in (("sample", stacks), ("cprofile", stacks_cprofile)):
+            if not data:
+                continue
+            path = os.path.join(self.directory, "%s-%d.collapsed" % (mode, pid))
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                for stack, count in sorted(data.items()):
+                    f.write("%s %d\n" % (stack, count))
+            os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _collapse_pstats(merged):
+        # cProfile only records caller/callee pairs, so emit two-frame stacks
+        # weighted by own time in microseconds
+        def label(func):
+            filename, line, name = func
+            return "%s (%s:%d)" % (name, os.path.basename(filename), line)
+
+        stacks = {}
+        for func, (_, _, tottime, _, callers) in merged.stats.items():
+            total_calls = sum(c[0] for c in callers.values()) or 1
+            if not callers:
+                stacks[label(func)] = stacks.get(label(func), 0) + int(tottime * 1e6)
+            for caller, caller_stats in callers.items():
+                share = int(tottime * 1e6 * caller_stats[0] / total_calls)
+                if share:
+                    key = label(caller) + ";" + label(func)
+                    stacks[key] = stacks.get(key, 0) + share
+        return stacks
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "profiled": self.profiled,
+            "samples": self.samples,
+            "skipped": self.skipped,
+            "directory": self.directory,
+        }
@@ -0,0 +1,128 @@
+# File: api/rum.py
+"""Real-user latency telemetry aggregated into mergeable percentile sketches
+
+The page beacons batches of {"metric": name, "value": milliseconds}. Each
+metric is kept as a log-bucketed histogram (the DDSketch scheme): a value
+lands in bucket ceil(log(v) / log(gamma)), so every reported percentile is
+within the relative accuracy of the true one, and a metric spanning 1 ms to
+10 minutes needs at most a few hundred counters however many samples arrive.
+
+Buckets are aggregated in memory and periodically added to the shared store
+as "<day>|<metric>|<bucket>" counters in the "rum" namespace, so sketches
+from every worker merge into the same daily totals. Metrics are a fixed set
+and values are capped, so the namespace holds at most max_entries() keys
+however much (or however varied) traffic the beacon endpoint receives.
+"""
+import math
+import threading
+import time
+
+from api.background import today
+
+PAGE_METRICS = ("page.dns", "page.connect", "page.tls", "page.ttfb", "page.fcp", "page.lcp",
+                "page.dom_ready", "page.load")
+MESSAGE_METRICS = ("message.ttfb", "message.rendered", "message.network")
+TRANSPORTS = ("http", "ws", "job")
+METRICS = frozenset(PAGE_METRICS + tuple("%s.%s" % (m, t) for m in MESSAGE_METRICS for t in TRANSPORTS))
+
+MAX_VALUE_MS = 10 * 60 * 1000
+QUANTILES = (0.5, 0.75, 0.9, 0.99)
+
+
+class LogHistogram:
+    """Quantile sketch with bounded relative error; values below 1 ms share one bucket"""
+
+    def __init__(self, relative_accuracy=0.02):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts = {}
+        self.count = 0
+
+    def bucket(self, value):
+        return math.ceil(math.log(value) / self._log_gamma) if value > 1.0 else 0
+
+    def add(self, value, count=1):
+        self.add_bucket(self.bucket(value), count)
+
+    def add_bucket(self, bucket, count):
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen > rank:
+                break
+        # Midpoint of the bucket (gamma^(b-1), gamma^b], in relative terms
+        return 2 * self.gamma ** bucket / (self.gamma + 1) if bucket else 0.0
+
+
+class RumAggregator:
+    """Collects beaconed timings and serves their percentiles"""
+
+    def __init__(self, store, relative_accuracy=0.02, flush_interval=10.0, retention_days=2):
+        self.store = store
+        self.relative_accuracy = relative_accuracy
+        self.flush_interval = flush_interval
+        self.ttl = retention_days * 86400
+        self._sketch = LogHistogram(relative_accuracy)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+
+    def record(self, events):
+        """Add a beacon's events; unknown metrics and implausible values are dropped"""
+        accepted = 0
+        with self._lock:
+            for event in events:
+                if not isinstance(event, dict):
+                    continue
+                metric = event.get("metric")
+                value = event.get("value")
+                if (metric not in METRICS or isinstance(value, bool) or not isinstance(value, (int, float))
+                        or not 0 <= value <= MAX_VALUE_MS):
+                    continue
+                key = (metric, self._sketch.bucket(value))
+                self._pending[key] = self._pending.get(key, 0) + 1
+                accepted += 1
+            self.accepted += accepted
+            self.rejected += len(events) - accepted
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return accepted
+
+    def max_entries(self):
+        """Upper bound on the keys this aggregator keeps in the store"""
+        return len(METRICS) * (self._sketch.bucket(MAX_VALUE_MS) + 1) * self.ttl // 86400
+
+    def flush(self):
+        """Add pending bucket counts to the store"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        day = today()
+        for (metric, bucket), count in pending.items():
+            self.store.incr("rum", "%s|%s|%d" % (day, metric, bucket), count, ttl=self.ttl)
+
+    def summary(self, day=None):
+        """Sample count and percentiles (ms) per metric for a day, across workers"""
+        self.flush()
+        day = day or today()
+        sketches = {}
+        for key, count in self.store.scan("rum", day + "|"):
+            _, metric, bucket = key.split("|")
+            sketch = sketches.setdefault(metric, LogHistogram(self.relative_accuracy))
+            sketch.add_bucket(int(bucket), count)
+        metrics = {}
+        for metric, sketch in sorted(sketches.items()):
+            entry = {"count": sketch.count}
+            for q in QUANTILES:
+                entry["p%d" % round(q * 100)] = round(sketch.quantile(q), 1)
+            metrics[metric] = entry
+        return {"day": day, "accepted": self.accepted, "rejected": self.rejected, "metrics": metrics}
@@ -0,0 +1,114 @@
+# File: api/speculation.py
+"""Book-keeping for speculative chat requests sent before the user finished speaking
+
+A speculation runs in the worker that received it, but the page's cancel
+may reach any worker, so its state lives in the shared store:
+
+  speculations       id -> "running" | "finished" | "cancelled"
+  speculation-wasted id -> claimed once, the first time the id counts as waste
+  speculation-stats  "<day>|<counter>" -> daily totals across workers
+
+A cancel only writes the state; the owning worker polls the state of its
+running speculations and stops the ones cancelled elsewhere. A cancel that
+arrives before its request leaves a "cancelled" state behind, so the
+request is stopped as soon as it registers.
+"""
+import threading
+import time
+
+from api.background import BackgroundThreads, today
+
+COUNTERS = ("started", "completed", "cancelled", "wasted")
+
+
+class SpeculationRegistry:
+    """In-flight speculative requests, cancellable by their client-chosen id from any worker"""
+
+    def __init__(self, store, ttl=300, poll_interval=0.2):
+        self.store = store
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._watcher = BackgroundThreads((self._watch, "speculation-cancels"))
+
+    def register(self, speculation_id, deadline):
+        self._count("started")
+        if not self.store.add("speculations", speculation_id, "running", ttl=self.ttl):
+            if self.store.get("speculations", speculation_id) == "cancelled":
+                self._count("cancelled")
+                self._waste(speculation_id)
+                deadline.cancel()
+                return
+        self._watcher.ensure_started()
+        with self._lock:
+            self._in_flight[speculation_id] = deadline
+
+    def finish(self, speculation_id):
+        with self._lock:
+            deadline = self._in_flight.pop(speculation_id, None)
+        if deadline is None:
+            return
+        self._count("completed")
+        # The answer may still be discarded by the page
+        self.store.set("speculations", speculation_id, "finished", ttl=self.ttl)
+
+    def cancel(self, speculation_id):
+        """Mark a speculation as wasted and abort it if it is still running
+
+        Returns True if the request was still running, here or in another
+        worker. Only ids that are (or later get) registered count as waste,
+        so stray cancels cannot inflate the waste rate.
+        """
+        if not speculation_id:
+            return False
+        with self._lock:
+            deadline = self._in_flight.pop(speculation_id, None)
+        if deadline is None and self.store.add("speculations", speculation_id, "cancelled", ttl=self.ttl):
+            return False
+        state = self.store.get("speculations", speculation_id)
+        running = deadline is not None or state == "running"
+        if running or state == "finished":
+            self.store.set("speculations", speculation_id, "cancelled", ttl=self.ttl)
+            if self._waste(speculation_id) and running:
+                self._count("cancelled")
+        if deadline is not None:
+            deadline.cancel()
+        return running
+
+    def stats(self, day=None):
+        """Daily totals across workers; in_flight counts this process only"""
+        day = day or today()
+        totals = dict.fromkeys(COUNTERS, 0)
+        for key, value in self.store.scan("speculation-stats", day + "|"):
+            totals[key.split("|", 1)[1]] = value
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return dict(
+            totals,
+            day=day,
+            in_flight=in_flight,
+            waste_rate=round(totals["wasted"] / totals["started"], 4) if totals["started"] else 0.0,
+        )
+
+    def _waste(self, speculation_id):
+        # A speculation is wasted once, however many cancels name it
+        if not self.store.add("speculation-wasted", speculation_id, True, ttl=self.ttl):
+            return False
+        self._count("wasted")
+        return True
+
+    def _count(self, counter, amount=1):
+        self.store.incr("speculation-stats", "%s|%s" % (today(), counter), amount, ttl=8 * 86400)
+
+    def _watch(self):
+        # Cancels that reached another worker only changed the store; stop those requests here
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                running = list(self._in_flight.items())
+            for speculation_id, deadline in running:
+                if self.store.get("speculations", speculation_id) == "cancelled":
+                    with self._lock:
+                        self._in_flight.pop(speculation_id, None)
+                    deadline.cancel()
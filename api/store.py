@@ -0,0 +1,222 @@
+# File: api/store.py
+"""Key/value store shared by response caches, sessions and rate-limit counters
+
+MemoryStore keeps state per process (the serverless default). SQLiteStore
+puts it in one WAL-mode database file, so every worker of a multi-process
+server on the same box sees the same caches and counters.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryStore:
+    """Thread-safe in-process store with TTLs and a bounded number of entries
+
+    Entries in the `pinned` namespaces (counters that must not silently
+    reset, such as usage quotas) are kept apart from the LRU and never
+    evicted; they only go away when they expire.
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_entries=10000, pinned=(), sweep_interval=60.0):
+        self.max_entries = max_entries
+        self.pinned = frozenset(pinned)
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._pinned = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            table = self._table(namespace)
+            item = table.get((namespace, key))
+            if item is None:
+                return default
+            value, expires = item
+            if expires and expires < time.time():
+                del table[(namespace, key)]
+                return default
+            if table is self._data:
+                self._data.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self._put(namespace, key, value, ttl)
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set only if the key is absent (or expired); returns True if it was set"""
+        with self._lock:
+            item = self._table(namespace).get((namespace, key))
+            if item is not None and not (item[1] and item[1] < time.time()):
+                return False
+            self._put(namespace, key, value, ttl)
+            return True
+
+    def incr(self, namespace, key, amount=1, ttl=None):
+        """Add to a counter and return the new value; the TTL starts with the counter"""
+        with self._lock:
+            table = self._table(namespace)
+            item = table.get((namespace, key))
+            if item is None or (item[1] and item[1] < time.time()):
+                self._put(namespace, key, amount, ttl)
+                return amount
+            value = item[0] + amount
+            table[(namespace, key)] = (value, item[1])
+            return value
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._table(namespace).pop((namespace, key), None)
+
+    def scan(self, namespace, prefix=""):
+        """Live (key, value) pairs in a namespace whose key starts with prefix"""
+        now = time.time()
+        with self._lock:
+            return [(key, value) for (ns, key), (value, expires) in self._table(namespace).items()
+                    if ns == namespace and key.startswith(prefix) and not (expires and expires < now)]
+
+    def stats(self):
+        with self._lock:
+            namespaces = {}
+            for namespace, _ in list(self._data) + list(self._pinned):
+                namespaces[namespace] = namespaces.get(namespace, 0) + 1
+        return {"backend": self.backend, "entries": namespaces}
+
+    def _table(self, namespace):
+        return self._pinned if namespace in self.pinned else self._data
+
+    def _put(self, namespace, key, value, ttl):
+        expires = time.time() + ttl if ttl else 0
+        if namespace in self.pinned:
+            self._pinned[(namespace, key)] = (value, expires)
+            self._sweep_pinned()
+            return
+        self._data[(namespace, key)] = (value, expires)
+        self._data.move_to_end((namespace, key))
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def _sweep_pinned(self):
+        # Pinned entries are not evicted, so expired ones are dropped here
+        if time.monotonic() < self._next_sweep:
+            return
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        now = time.time()
+        for item_key in [k for k, (_, expires) in self._pinned.items() if expires and expires < now]:
+            del self._pinned[item_key]
+
+
+class SQLiteStore:
+    """Cross-process store in a single SQLite database file
+
+    Each thread (and each forked worker) opens its own connection; values
+    are stored as JSON. Expired rows are ignored on read and purged lazily.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, purge_probability=0.001):
+        self.path = path
+        self.purge_probability = purge_probability
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires = 0 OR expires >= ?)",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value, ttl=None):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time.time() + ttl if ttl else 0),
+        )
+        self._maybe_purge()
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set only if the key is absent (or expired); returns True if it was set"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ? AND expires != 0 AND expires < ?",
+                         (namespace, key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now + ttl if ttl else 0),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def incr(self, namespace, key, amount=1, ttl=None):
+        """Add to a counter and return the new value; the TTL starts with the counter"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ? AND expires != 0 AND expires < ?",
+                         (namespace, key, now))
+            conn.execute(
+                "INSERT INTO kv (namespace, key, value, expires) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET value = value + excluded.value",
+                (namespace, key, json.dumps(amount), now + ttl if ttl else 0),
+            )
+            value = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?",
+                                 (namespace, key)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_purge()
+        return json.loads(str(value))
+
+    def delete(self, namespace, key):
+        self._connect().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def scan(self, namespace, prefix=""):
+        """Live (key, value) pairs in a namespace whose key starts with prefix"""
+        rows = self._connect().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND substr(key, 1, ?) = ?"
+            " AND (expires = 0 OR expires >= ?)",
+            (namespace, len(prefix), prefix, time.time()),
+        ).fetchall()
+        return [(key, json.loads(str(value))) for key, value in rows]
+
+    def stats(self):
+        rows = self._connect().execute(
+            "SELECT namespace, COUNT(*) FROM kv WHERE expires = 0 OR expires >= ? GROUP BY namespace",
+            (time.time(),),
+        ).fetchall()
+        return {"backend": self.backend, "path": self.path, "entries": dict(rows)}
+
+    def _maybe_purge(self):
+        if random.random() < self.purge_probability:
+            self._connect().execute("DELETE FROM kv WHERE expires != 0 AND expires < ?", (time.time(),))
@@ -0,0 +1,125 @@
+# File: api/summary.py
+"""Running summaries of older conversation turns, extended in the background
+
+Once a conversation's history passes `threshold` turns, everything but the
+last `keep` turns is folded into a summary by a background thread, after
+the reply has gone out. Later turns send the summary plus the raw tail, so
+the prompt stays roughly the same size however long the session runs.
+
+Summaries are cached per conversation in the shared store ("summaries"
+namespace) together with how many turns they cover and a digest of those
+turns; a history that does not start with exactly those turns (say, the
+page was reloaded) is sent in full instead. Each extension summarizes only
+the previous summary plus the newly folded turns.
+"""
+import hashlib
+import json
+import queue
+
+from api.background import BackgroundThreads
+
+
+def turns_digest(turns):
+    return hashlib.sha256(json.dumps(turns, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ConversationSummarizer:
+    """Condenses histories on the request path and folds them off it
+
+    summarize(previous_summary, turns, account) -> str makes the upstream
+    call; it runs only on the background thread.
+    """
+
+    def __init__(self, store, summarize, threshold=12, keep=6, ttl=24 * 3600, max_queue=100):
+        self.store = store
+        self.summarize = summarize
+        self.threshold = threshold
+        self.keep = keep
+        self.ttl = ttl
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = BackgroundThreads((self._run, "conversation-summarizer"))
+
+        self.condensed = 0
+        self.stale = 0
+        self.scheduled = 0
+        self.summarized = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def condense(self, conversation, history):
+        """History to send upstream: the cached summary plus the turns after it"""
+        entry = self._entry(conversation, history, count_stale=True)
+        if entry is None:
+            return history
+        self.condensed += 1
+        summary = {"role": "system", "content": "Summary of the earlier conversation:\n" + entry["summary"]}
+        return [summary] + history[entry["turns"]:]
+
+    def schedule(self, conversation, history, account=None):
+        """Queue folding of older turns once the raw tail outgrows the threshold"""
+        if not conversation:
+            return
+        entry = self._entry(conversation, history)
+        folded = entry["turns"] if entry else 0
+        if len(history) - folded <= self.threshold:
+            return
+        self._worker.ensure_started()
+        try:
+            self._queue.put_nowait((conversation, history, account))
+            self.scheduled += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "condensed": self.condensed,
+            "stale": self.stale,
+            "scheduled": self.scheduled,
+            "summarized": self.summarized,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    def _entry(self, conversation, history, count_stale=False):
+        if not conversation:
+            return None
+        entry = self.store.get("summaries", conversation)
+        if entry is None:
+            return None
+        if entry["turns"] > len(history) or turns_digest(history[:entry["turns"]]) != entry["digest"]:
+            if count_stale:
+                self.stale += 1
+            return None
+        return entry
+
+    def _run(self):
+        while True:
+            conversation, history, account = self._queue.get()
+            try:
+                self._fold(conversation, history, account)
+            except Exception:
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def _fold(self, conversation, history, account):
+        # One fold per conversation at a time, across workers
+        if not self.store.add("summary-locks", conversation, True, ttl=120):
+            return
+        try:
+            entry = self._entry(conversation, history)
+            folded = entry["turns"] if entry else 0
+            target = len(history) - self.keep
+            if target <= folded:
+                return
+            summary = self.summarize(entry["summary"] if entry else "", history[folded:target], account)
+            self.store.set("summaries", conversation, {
+                "turns": target,
+                "digest": turns_digest(history[:target]),
+                "summary": summary,
+            }, ttl=self.ttl)
+            self.summarized += 1
+        finally:
+            self.store.delete("summary-locks", conversation)
@@ -0,0 +1,116 @@
+# File: api/triage.py
+"""Local emergency/triage pre-classifier built on an Aho-Corasick phrase automaton"""
+import json
+import re
+
+SEVERITY_RANK = {"none": 0, "low": 1, "medium": 2, "high": 3}
+
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase, collapse punctuation to single spaces and pad for word boundaries"""
+    return " " + NON_WORD_RE.sub(" ", text.lower()).strip() + " "
+
+
+class TriageResult:
+    """Outcome of classifying one message"""
+    __slots__ = ("severity", "category", "tags", "response")
+
+    def __init__(self, severity, category, tags, response):
+        self.severity = severity
+        self.category = category
+        self.tags = tags
+        self.response = response
+
+
+NO_MATCH = TriageResult("none", None, [], None)
+
+
+class TriageClassifier:
+    """Matches every lexicon phrase in one pass over the message
+
+    Phrases are normalized like messages and padded with spaces, so a
+    match always starts and ends on a word boundary ("ache" does not
+    fire inside "headache").
+    """
+
+    def __init__(self, categories):
+        self.categories = categories
+        self.counts = {}
+        # Trie as parallel lists: goto transitions, failure links, and the
+        # categories whose phrases end at each state
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for name, category in categories.items():
+            for phrase in category["phrases"]:
+                self._add(normalize(phrase), name)
+        self._link()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["categories"])
+
+    def _add(self, phrase, name):
+        state = 0
+        for char in phrase:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][char] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = following
+        if name not in self._out[state]:
+            self._out[state] += (name,)
+
+    def _link(self):
+        # Breadth-first so each failure target is final before it is used
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[following] = target if target != following else 0
+                self._out[following] += tuple(n for n in self._out[self._fail[following]]
+                                              if n not in self._out[following])
+
+    def matches(self, text):
+        """Set of category names with at least one phrase in the text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in normalize(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def classify(self, text):
+        """Most severe matching category plus every matched tag"""
+        found = self.matches(text)
+        if not found:
+            self.counts["none"] = self.counts.get("none", 0) + 1
+            return NO_MATCH
+
+        tags = sorted(found)
+        for tag in tags:
+            self.counts[tag] = self.counts.get(tag, 0) + 1
+        category = max(tags, key=lambda name: SEVERITY_RANK[self.categories[name]["severity"]])
+        details = self.categories[category]
+        return TriageResult(details["severity"], category, tags, details.get("response"))
+
+    def stats(self):
+        return {
+            "states": len(self._goto),
+            "counts": dict(self.counts),
+        }
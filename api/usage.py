@@ -0,0 +1,122 @@
+# File: api/usage.py
+"""Token usage and cost accounting per client, session and model, with quotas"""
+import threading
+import time
+
+from api.background import today
+
+# USD per 1K tokens (prompt, completion); unknown models are costed as gpt-4
+PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cost_usd", "latency_ms")
+
+DIMENSIONS = ("client", "session", "model")
+
+
+def usage_key(day, dimension, name, field):
+    return "%s|%s|%s|%s" % (day, dimension, name.replace("|", "/"), field)
+
+
+class UsageTracker:
+    """Aggregates usage in memory and periodically adds it to the shared store
+
+    Store keys are "<day>|<dimension>|<name>|<field>" in the "usage"
+    namespace, so every worker's flushes sum into the same daily totals.
+    Quota checks add this process's unflushed usage to the stored total.
+    """
+
+    def __init__(self, store, flush_interval=10.0, retention_days=7):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.ttl = retention_days * 86400
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+
+    def record(self, client, session, model, usage, latency, count_model=True):
+        """Account one upstream call from its response 'usage' block
+
+        Calls made on nobody's behalf pass no client or session. With
+        count_model=False only the client and session are charged, for
+        spend already counted against the model when it was made.
+        """
+        prompt_tokens = int(usage.get("prompt_tokens", 0))
+        completion_tokens = int(usage.get("completion_tokens", 0))
+        prompt_price, completion_price = PRICES.get(model, PRICES["gpt-4"])
+        values = {
+            "calls": 1,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000,
+            "latency_ms": int(latency * 1000),
+        }
+        day = today()
+        with self._lock:
+            for dimension, name in (("client", client), ("session", session), ("model", count_model and model)):
+                if not name:
+                    continue
+                for field, value in values.items():
+                    key = usage_key(day, dimension, name, field)
+                    self._pending[key] = self._pending.get(key, 0) + value
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Add pending usage to the store"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        for key, value in pending.items():
+            self.store.incr("usage", key, value, ttl=self.ttl)
+        self.flushes += 1
+
+    def tokens_used(self, dimension, name):
+        """Tokens consumed today, across workers plus this process's unflushed usage"""
+        total = 0
+        for field in ("prompt_tokens", "completion_tokens"):
+            key = usage_key(today(), dimension, name, field)
+            total += self.store.get("usage", key, 0)
+            with self._lock:
+                total += self._pending.get(key, 0)
+        return total
+
+    def check(self, client, session, client_limit, session_limit, downgrade_at):
+        """Quota decision before an upstream call: 'ok', 'downgrade' or 'reject'
+
+        downgrade_at is the fraction of a limit past which the cheaper model is used.
+        """
+        decision = "ok"
+        for dimension, name, limit in (("client", client, client_limit), ("session", session, session_limit)):
+            if not (name and limit):
+                continue
+            used = self.tokens_used(dimension, name)
+            if used >= limit:
+                return "reject"
+            if used >= limit * downgrade_at:
+                decision = "downgrade"
+        return decision
+
+    def summary(self, day=None, top=20):
+        """Daily totals per dimension, heaviest consumers first"""
+        self.flush()
+        day = day or today()
+        result = {dimension + "s": {} for dimension in DIMENSIONS}
+        for key, value in self.store.scan("usage", day + "|"):
+            _, dimension, name, field = key.split("|", 3)
+            entry = result[dimension + "s"].setdefault(name, dict.fromkeys(FIELDS, 0))
+            entry[field] = value
+        for dimension, entries in result.items():
+            for entry in entries.values():
+                entry["cost_usd"] = round(entry["cost_usd"], 6)
+                entry["total_tokens"] = entry["prompt_tokens"] + entry["completion_tokens"]
+            ranked = sorted(entries.items(), key=lambda item: item[1]["total_tokens"], reverse=True)
+            result[dimension] = dict(ranked[:top])
+        result["day"] = day
+        return result
@@ -0,0 +1,94 @@
+"""Benchmark serverless cold start: module import time and time to first response
+
+Usage: python benchmarks/bench_cold_start.py [--runs N] [--max-import-ms MS] [--max-first-response-ms MS]
+
+Every run starts a fresh interpreter, imports api.index and serves the first
+request through the WSGI test client, the same work a new function instance
+does. With the --max-* budgets the script exits non-zero on regression.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from api.index import app
+t1 = time.perf_counter()
+client = app.test_client()
+response = client.get(sys.argv[1], headers={"Accept-Encoding": "gzip"})
+assert response.status_code == 200, response.status_code
+t2 = time.perf_counter()
+response = client.post("/api/chat", json={"message": "benefits of walking", "history": []})
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first": t2 - t1, "first_chat": t3 - t2, "modules": len(sys.modules)}))
+"""
+
+
+def run_probe(path):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.check_output([sys.executable, "-c", PROBE, path], cwd=ROOT, env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def slowest_imports(limit):
+    """Largest cumulative import times reported by -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api.index"],
+                            cwd=ROOT, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    rows = []
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        # Keep api.index and the modules it imports directly
+        if len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-first-response-ms", type=float)
+    parser.add_argument("--top-imports", type=int, default=8)
+    args = parser.parse_args()
+
+    samples = [run_probe(args.path) for _ in range(args.runs)]
+    import_ms = median([s["import"] for s in samples]) * 1000
+    first_ms = median([s["first"] for s in samples]) * 1000
+    chat_ms = median([s["first_chat"] for s in samples]) * 1000
+
+    print("runs                     %d" % args.runs)
+    print("modules loaded           %d" % samples[-1]["modules"])
+    print("import time              %.1f ms (median)" % import_ms)
+    print("first response %-9s %.1f ms (median)" % (args.path, first_ms))
+    print("import + first response  %.1f ms" % (import_ms + first_ms))
+    print("first /api/chat (local)  %.1f ms (median)" % chat_ms)
+    if args.top_imports:
+        print("slowest direct imports (cumulative):")
+        for cumulative_us, name in slowest_imports(args.top_imports):
+            print("  %8.1f ms  %s" % (cumulative_us / 1000, name))
+
+    failed = False
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print("FAIL: import time over budget of %.1f ms" % args.max_import_ms)
+        failed = True
+    if args.max_first_response_ms is not None and import_ms + first_ms > args.max_first_response_ms:
+        print("FAIL: time to first response over budget of %.1f ms" % args.max_first_response_ms)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark knowledge base index build time, memory footprint and query latency
+
+Usage: python benchmarks/bench_knowledge.py [--scale N] [--queries N]
+
+--scale replicates the curated corpus N times (with shuffled vocabulary) to
+see how the index behaves well beyond the size of the shipped FAQ.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.knowledge import KnowledgeBase, load_entries, tokenize  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "api", "data", "health_faq.json")
+
+SAMPLE_QUERIES = [
+    "how much water should I drink",
+    "benefits of walking",
+    "how many hours of sleep do adults need",
+    "what is a normal blood pressure",
+    "is coffee bad for me",
+    "my knee hurts after running",
+    "tips for eating healthy",
+    "what can I take for a headache",
+]
+
+
+def synthetic_entries(entries, scale, rng):
+    """Replicate the corpus with words reshuffled so postings grow realistically"""
+    vocabulary = sorted({t for e in entries for t in tokenize(e["answer"] + " " + " ".join(e["questions"]))})
+    result = list(entries)
+    for i in range(len(entries) * (scale - 1)):
+        base = entries[i % len(entries)]
+        words = rng.sample(vocabulary, min(len(vocabulary), 60))
+        result.append({
+            "id": "%s-%d" % (base["id"], i),
+            "questions": [" ".join(words[:6])],
+            "answer": " ".join(words[6:]),
+            "keywords": words[:2],
+        })
+    return result
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    entries = synthetic_entries(load_entries(args.corpus), args.scale, rng)
+
+    # Build time (best of five) and retained memory of one build
+    builds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        KnowledgeBase(entries)
+        builds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kb = KnowledgeBase(entries)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    # Query latency over a mix of FAQ-style and unrelated questions
+    latencies = []
+    hits = 0
+    for i in range(args.queries):
+        query = SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]
+        start = time.perf_counter()
+        if kb.answer(query, 0.75):
+            hits += 1
+        latencies.append(time.perf_counter() - start)
+
+    stats = kb.stats()
+    print("entries            %d" % stats["entries"])
+    print("terms              %d" % stats["terms"])
+    print("postings           %d" % stats["postings"])
+    print("build time         %.2f ms (best of 5)" % (min(builds) * 1000))
+    print("retained memory    %.1f KiB (peak %.1f KiB)" % (retained / 1024, peak / 1024))
+    print("query p50          %.1f us" % (percentile(latencies, 50) * 1e6))
+    print("query p99          %.1f us" % (percentile(latencies, 99) * 1e6))
+    print("direct answer rate %.0f%%" % (100.0 * hits / len(latencies)))
+
+
+if __name__ == "__main__":
+    main()
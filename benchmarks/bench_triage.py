@@ -0,0 +1,72 @@
+"""Benchmark the triage pre-classifier on large synthetic message sets
+
+Usage: python benchmarks/bench_triage.py [--messages N] [--words N] [--hit-rate R]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.triage import TriageClassifier  # noqa: E402
+
+DEFAULT_LEXICON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "api", "data", "triage_lexicon.json")
+
+FILLER = ("i have been feeling a bit off lately with some tiredness and mild aches after work "
+          "what should i eat to stay healthy is it normal to feel this way in the morning "
+          "my doctor said to rest and drink water how long will it take to recover").split()
+
+
+def synthetic_messages(classifier, count, words, hit_rate, rng):
+    phrases = [p for c in classifier.categories.values() for p in c["phrases"]]
+    messages = []
+    for _ in range(count):
+        parts = [rng.choice(FILLER) for _ in range(words)]
+        if rng.random() < hit_rate:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(phrases))
+        messages.append(" ".join(parts))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lexicon", default=DEFAULT_LEXICON)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=25)
+    parser.add_argument("--hit-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    classifier = TriageClassifier.load(args.lexicon)
+    build = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    messages = synthetic_messages(classifier, args.messages, args.words, args.hit_rate, rng)
+    total_chars = sum(len(m) for m in messages)
+
+    latencies = []
+    high = 0
+    start = time.perf_counter()
+    for message in messages:
+        t0 = time.perf_counter()
+        if classifier.classify(message).severity == "high":
+            high += 1
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    print("automaton states   %d" % len(classifier._goto))
+    print("build time         %.2f ms" % (build * 1000))
+    print("messages           %d (avg %d chars)" % (len(messages), total_chars // len(messages)))
+    print("throughput         %.0f msg/s, %.1f MB/s" % (len(messages) / elapsed, total_chars / elapsed / 1e6))
+    print("latency p50        %.1f us" % (latencies[len(latencies) // 2] * 1e6))
+    print("latency p99        %.1f us" % (latencies[int(len(latencies) * 0.99)] * 1e6))
+    print("high severity      %.1f%%" % (100.0 * high / len(messages)))
+
+
+if __name__ == "__main__":
+    main()
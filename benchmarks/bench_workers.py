@@ -0,0 +1,191 @@
+"""Benchmark throughput of the production server as the worker count grows
+
+Usage: python benchmarks/bench_workers.py [--workers 1,2,4] [--seconds S] [--clients N]
+                                          [--model-share F] [--distinct N] [--upstream-ms MS] [--no-cache]
+
+Starts gunicorn with gunicorn.conf.py for each worker count and drives
+/api/chat from keep-alive client threads. A --model-share of the turns are
+questions the knowledge base cannot answer; they go to a local stub of the
+OpenAI API that answers after --upstream-ms. The clients ask the same
+--distinct questions, so the shared response cache and the deduplication of
+identical in-flight requests decide how many upstream calls are made; the
+stub counts them, and without the cache (--no-cache) every model-bound turn
+is one call. The rest are knowledge-base questions answered locally.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "how much water should I drink",
+    "benefits of walking",
+    "how many hours of sleep do adults need",
+    "what is a normal blood pressure",
+]
+
+# Not covered by the knowledge base, so every one of them needs the model
+MODEL_TOPICS = [
+    "shingles", "gout", "tinnitus", "eczema", "vertigo", "sciatica", "psoriasis", "rosacea",
+    "plantar fasciitis", "carpal tunnel", "lactose intolerance", "restless legs", "bunions",
+    "hay fever", "cold sores", "tennis elbow", "heartburn", "warts", "dandruff", "hiccups",
+]
+
+
+def model_questions(count):
+    templates = ["what causes %s", "how is %s treated", "can %s come back", "is %s contagious"]
+    return [templates[i // len(MODEL_TOPICS) % len(templates)] % MODEL_TOPICS[i % len(MODEL_TOPICS)]
+            for i in range(count)]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def start_stub(latency):
+    """Upstream stand-in answering every completion after `latency` seconds; counts its calls"""
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            calls.append(1)
+            time.sleep(latency)
+            body = json.dumps({"choices": [{"message": {"content": "Stub answer."}}],
+                               "usage": {"prompt_tokens": 50, "completion_tokens": 10}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.calls = calls
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def drive(port, seconds, clients, model_share, questions):
+    """Returns (answered, errors, model-bound turns answered)"""
+    counts = [0] * clients
+    errors = [0] * clients
+    modelled = [0] * clients
+    stop = time.time() + seconds
+
+    def client(index):
+        rng = random.Random(index)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        n = 0
+        while time.time() < stop:
+            if rng.random() < model_share:
+                message = rng.choice(questions)
+            else:
+                message = QUESTIONS[n % len(QUESTIONS)]
+            body = json.dumps({"message": message, "history": []})
+            try:
+                conn.request("POST", "/api/chat", body=body, headers={
+                    "Content-Type": "application/json",
+                    "X-Forwarded-For": "10.0.%d.%d" % (index // 250, index % 250),
+                })
+                response = conn.getresponse()
+                reply = json.loads(response.read() or b"{}")
+                if response.status == 200:
+                    counts[index] += 1
+                    if "source" not in reply:
+                        modelled[index] += 1
+                else:
+                    errors[index] += 1
+            except (OSError, ValueError):
+                errors[index] += 1
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts), sum(errors), sum(modelled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--model-share", type=float, default=0.5,
+                        help="fraction of turns that need the model (default 0.5)")
+    parser.add_argument("--distinct", type=int, default=40,
+                        help="distinct model-bound questions the clients share (default 40)")
+    parser.add_argument("--upstream-ms", type=float, default=300,
+                        help="latency of the stubbed upstream (default 300)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the shared response cache")
+    args = parser.parse_args()
+
+    questions = model_questions(args.distinct)
+    baseline = None
+    print("cpus %d  model share %.2f  distinct %d  upstream %.0f ms  cache %s"
+          % (os.cpu_count(), args.model_share, len(questions), args.upstream_ms, "off" if args.no_cache else "on"))
+    for workers in [int(w) for w in args.workers.split(",")]:
+        stub = start_stub(args.upstream_ms / 1000)
+        port = free_port()
+        store = os.path.join(tempfile.mkdtemp(), "store.sqlite3")
+        env = dict(os.environ, BIND="127.0.0.1:%d" % port, WEB_CONCURRENCY=str(workers),
+                   THREADS=str(args.threads), SHARED_STORE_PATH=store, RATE_LIMIT_PER_MINUTE="0",
+                   TRUSTED_PROXY_COUNT="1",
+                   OPENAI_API_HOST="127.0.0.1:%d" % stub.server_address[1], OPENAI_API_TLS="0",
+                   OPENAI_API_KEY="bench", USAGE_CLIENT_DAILY_TOKENS="0", USAGE_SESSION_DAILY_TOKENS="0",
+                   CAPTURE_DIR="", CHAT_LOG_DIR="", FOLLOWUP_COUNT="0", SUMMARY_AFTER_TURNS="0")
+        if args.no_cache:
+            env["RESPONSE_CACHE_TTL"] = "0"
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                   "--access-logfile", "/dev/null", "api.index:app"],
+                                  cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port)
+            done, failed, modelled = drive(port, args.seconds, args.clients, args.model_share, questions)
+        finally:
+            server.terminate()
+            server.wait()
+            stub.shutdown()
+        rate = done / args.seconds
+        baseline = baseline or rate
+        calls = len(stub.calls)
+        print("workers %-3d %8.0f req/s  speedup %.2fx  errors %d  model turns %d  upstream calls %d (%.2f per turn)"
+              % (workers, rate, rate / baseline, failed, modelled, calls, calls / modelled if modelled else 0.0))
+
+
+if __name__ == "__main__":
+    main()
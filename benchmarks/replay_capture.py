@@ -0,0 +1,276 @@
+"""Replay captured chat traffic against a local server with a stubbed upstream
+
+Usage: python benchmarks/replay_capture.py CAPTURE [CAPTURE ...] [--speed 1,4,max] [--workers N]
+
+CAPTURE is a file or directory written with CAPTURE_DIR set (see
+api/capture.py). For each speed a fresh gunicorn server is started whose
+upstream is a local stub answering with the recorded status, response size
+and latency of each turn. Turns are sent at their recorded offsets divided
+by the speed, or as fast as --concurrency clients allow with "max".
+
+Messages are synthesized to the recorded shape: triage and knowledge-base
+turns use a real emergency phrase or FAQ question, model turns use filler
+of the recorded length that matches neither (turns sharing a hash get the
+same text, so response-cache hits recur). Rate-limited, over-quota and
+cancelled turns are skipped.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SKIPPED_SOURCES = ("rate_limited", "quota", "cancelled")
+
+# Nonsense syllables: filler built from them never matches the FAQ or triage lexicon
+SYLLABLES = ("ka", "zu", "mi", "tor", "vel", "quo", "pex", "lun", "dra", "siv")
+
+REF_RE = re.compile(r"\bref(\d+)\b")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def load_trace(paths):
+    """Captured turns from files and directories, oldest first"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.startswith("capture-"))
+        else:
+            files.append(path)
+    records = []
+    for path in files:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def filler(rng, length, marker=""):
+    words = [marker] if marker else []
+    size = len(marker)
+    while size < length:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:max(length, len(marker))]
+
+
+def synthesize(records):
+    """One (message, history, session) per record, shaped like the original"""
+    with open(os.path.join(ROOT, "api", "data", "health_faq.json"), encoding="utf-8") as f:
+        questions = [entry["questions"][0] for entry in json.load(f)["entries"]]
+    with open(os.path.join(ROOT, "api", "data", "triage_lexicon.json"), encoding="utf-8") as f:
+        phrases = [phrase for category in json.load(f)["categories"].values()
+                   if category["severity"] == "high" for phrase in category["phrases"]]
+
+    first_index = {}
+    requests = []
+    for index, record in enumerate(records):
+        first = first_index.setdefault(record["k"], index)
+        rng = random.Random(record["k"])
+        turns = []
+        per_turn = record["hc"] // record["h"] if record["h"] else 0
+        for turn in range(record["h"]):
+            turns.append({"role": "user" if turn % 2 == 0 else "assistant", "content": filler(rng, per_turn)})
+        if record["src"] == "triage":
+            message = rng.choice(phrases)
+            message = message + " " + filler(rng, record["m"] - len(message) - 1)
+        elif record["src"] == "knowledge_base":
+            message = rng.choice(questions)
+        else:
+            message = filler(rng, record["m"], "ref%d" % first)
+        requests.append((message, turns, record["s"]))
+    return requests
+
+
+def start_stub(records):
+    """Upstream stand-in that replays each turn's recorded upstream attempts"""
+    attempts = {}
+    lock = threading.Lock()
+    fallback = [up for record in records for up in record["up"] if up[4] == 200]
+    default = sorted(fallback, key=lambda up: up[3])[len(fallback) // 2] if fallback else [0, 200, 0, 0, 200]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            match = REF_RE.search(data["messages"][-1]["content"])
+            profile = default
+            if match:
+                index = int(match.group(1))
+                with lock:
+                    attempt = attempts.get(index, 0)
+                    attempts[index] = attempt + 1
+                recorded = records[index]["up"] if index < len(records) else []
+                if recorded:
+                    profile = recorded[min(attempt, len(recorded) - 1)]
+            _, size, first_byte, total, status = profile
+            time.sleep(first_byte / 1000)
+            if not status:
+                self.close_connection = True
+                return
+            content = "x" * max(0, size - 120)
+            body = json.dumps({"choices": [{"message": {"content": content}}],
+                               "usage": {"prompt_tokens": 0, "completion_tokens": 0}}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            time.sleep(max(0.0, total - first_byte) / 1000)
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def replay(port, records, requests, speed, concurrency):
+    """Drive the server; returns per-turn results and the wall-clock duration"""
+    local = threading.local()
+    results = [None] * len(records)
+
+    def send(index, due):
+        conn = getattr(local, "conn", None) or http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        local.conn = conn
+        message, history, session = requests[index]
+        body = json.dumps({"message": message, "history": history})
+        started = time.perf_counter()
+        try:
+            conn.request("POST", "/api/chat", body=body, headers={
+                "Content-Type": "application/json",
+                "X-Session-Id": session,
+                "X-Forwarded-For": "10.1.%d.%d" % (index // 250 % 250, index % 250),
+            })
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except OSError:
+            local.conn = None
+            status = 0
+        finished = time.perf_counter()
+        results[index] = (finished - started, status, started - due)
+
+    t0 = records[0]["t"]
+    workers = concurrency if speed is None else 256
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index, record in enumerate(records):
+            due = start
+            if speed is not None:
+                due = start + (record["t"] - t0) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, index, due)
+    return results, time.perf_counter() - start
+
+
+def report(label, records, results, duration):
+    latencies = [result[0] * 1000 for result in results]
+    errors = sum(1 for result in results if result[1] != 200)
+    print("replay %s" % label)
+    print("  turns      %d in %.1f s, %.1f req/s, errors %d" % (len(results), duration, len(results) / duration, errors))
+    print("  latency    p50 %.0f ms  p90 %.0f ms  p99 %.0f ms  max %.0f ms" % (
+        percentile(latencies, 0.5), percentile(latencies, 0.9), percentile(latencies, 0.99), max(latencies)))
+    if label != "max":
+        lag = [result[2] * 1000 for result in results]
+        print("  send lag   p99 %.1f ms" % percentile(lag, 0.99))
+    for source in sorted({record["src"] for record in records}):
+        replayed = [latencies[i] for i, record in enumerate(records) if record["src"] == source]
+        recorded = [record["ms"] for record in records if record["src"] == source]
+        print("  %-15s n=%-5d p50 %6.0f ms (recorded %6.0f)  p99 %6.0f ms (recorded %6.0f)" % (
+            source, len(replayed), percentile(replayed, 0.5), percentile(recorded, 0.5),
+            percentile(replayed, 0.99), percentile(recorded, 0.99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", nargs="+")
+    parser.add_argument("--speed", default="1", help="comma-separated multipliers, or 'max'")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients at max speed")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N turns")
+    args = parser.parse_args()
+
+    records = [record for record in load_trace(args.capture) if record["src"] not in SKIPPED_SOURCES]
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        sys.exit("no replayable turns in capture")
+    requests = synthesize(records)
+    span = records[-1]["t"] - records[0]["t"]
+    print("trace      %d turns over %.1f s" % (len(records), span))
+
+    for label in args.speed.split(","):
+        speed = None if label == "max" else float(label)
+        stub = start_stub(records)
+        port = free_port()
+        env = dict(os.environ, BIND="127.0.0.1:%d" % port, WEB_CONCURRENCY=str(args.workers),
+                   THREADS=str(args.threads), SHARED_STORE_PATH=os.path.join(tempfile.mkdtemp(), "store.sqlite3"),
+                   OPENAI_API_HOST="127.0.0.1:%d" % stub.server_address[1], OPENAI_API_TLS="0",
+                   OPENAI_API_KEY="replay", RATE_LIMIT_PER_MINUTE="0", CAPTURE_DIR="", CHAT_LOG_DIR="",
+                   USAGE_CLIENT_DAILY_TOKENS="0", USAGE_SESSION_DAILY_TOKENS="0", TRUSTED_PROXY_COUNT="1",
+                   # Captures hold chat turns only; background calls would skew the replay
+                   FOLLOWUP_COUNT="0", SUMMARY_AFTER_TURNS="0")
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                   "--access-logfile", "/dev/null", "api.index:app"],
+                                  cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port)
+            results, duration = replay(port, records, requests, speed, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+            stub.shutdown()
+        report(label if speed is None else label + "x", records, results, duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Production server configuration for running HealthAssist outside Vercel
+
+    pip install -r requirements-server.txt
+    gunicorn -c gunicorn.conf.py api.index:app
+
+The app is preloaded once in the master and its indexes are built before
+forking, so workers share them copy-on-write. Workers are threaded because
+a chat turn mostly waits on the upstream API. All workers share one SQLite
+store (SHARED_STORE_PATH) for the response cache, sessions and rate-limit
+counters; identical questions in flight are answered by a single upstream
+call. With flask-sock installed pages chat over a WebSocket at /api/ws.
+An open socket holds one worker thread for as long as its tab is open, so
+each worker admits at most WS_MAX_CHANNELS of them and refuses further
+upgrades; those pages chat over HTTP, which always keeps the remaining
+threads.
+
+Environment:
+    BIND                 address to listen on (default 0.0.0.0:8000)
+    WEB_CONCURRENCY      worker processes (default: one per CPU core)
+    THREADS              threads per worker (default 8)
+    SHARED_STORE_PATH    SQLite file shared by the workers
+                         (default /tmp/healthassist-store.sqlite3)
+    FUNCTION_MAX_DURATION_SECONDS
+                         longest a request may run (default 30); chat
+                         turns are cut short to fit
+    TRUSTED_PROXY_COUNT  reverse proxies in front of gunicorn whose
+                         X-Forwarded-For is believed (default 0: clients
+                         are identified by their socket address)
+    WS_MAX_CHANNELS      open WebSockets per worker (default: half of
+                         THREADS)
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault("SHARED_STORE_PATH", "/tmp/healthassist-store.sqlite3")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("THREADS", "8"))
+os.environ.setdefault("WS_MAX_CHANNELS", str(max(1, threads // 2)))
+worker_class = "gthread"
+preload_app = True
+
+# Chat turns end themselves within FUNCTION_MAX_DURATION_SECONDS (see
+# api/index.py); only kill truly stuck workers
+timeout = int(float(os.environ.get("FUNCTION_MAX_DURATION_SECONDS", "30"))) + 5
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+
+
+def when_ready(server):
+    # Runs in the master after the preload and before workers are forked
+    from api.index import warm_up
+    warm_up()
@@ -0,0 +1,162 @@
+import json
+import queue
+import threading
+
+import pytest
+
+from api import index
+from api.channel import ChatChannel
+from api.deadline import RequestCancelled
+
+CLOSED = object()
+
+
+class FakeSocket:
+    """Frames queued by the test stand in for the page; CLOSED drops the connection"""
+
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.sent = queue.Queue()
+        self.closed = False
+
+    def receive(self, timeout=None):
+        try:
+            raw = self.incoming.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if raw is CLOSED:
+            raise ConnectionError("closed")
+        return json.dumps(raw)
+
+    def send(self, data):
+        self.sent.put(json.loads(data))
+
+    def close(self):
+        self.closed = True
+
+    def next_frame(self, kind):
+        while True:
+            frame = self.sent.get(timeout=2)
+            if frame["type"] == kind:
+                return frame
+
+
+class FakeSpeculations:
+    def __init__(self):
+        self.registered, self.finished, self.cancelled = [], [], []
+
+    def register(self, request_id, deadline):
+        self.registered.append(request_id)
+
+    def finish(self, request_id):
+        self.finished.append(request_id)
+
+    def cancel(self, request_id):
+        self.cancelled.append(request_id)
+        return True
+
+
+def echo(message, history, deadline, on_delta, key):
+    for word in message.split():
+        on_delta(word)
+    return {"response": message.upper()}, 200
+
+
+def serving(answer=echo, speculations=None, **kwargs):
+    ws = FakeSocket()
+    channel = ChatChannel(ws, answer, speculations or FakeSpeculations(), 5.0, **kwargs)
+    thread = threading.Thread(target=channel.serve, daemon=True)
+    thread.start()
+    assert ws.next_frame("ready")["heartbeat"] == channel.heartbeat
+    return ws, thread
+
+
+def test_answers_stream_and_finish_with_the_request_id():
+    ws, _ = serving()
+    ws.incoming.put({"type": "chat", "id": "m1", "message": "drink water"})
+    assert ws.next_frame("token") == {"type": "token", "id": "m1", "delta": "drink"}
+    done = ws.next_frame("done")
+    assert (done["id"], done["status"], done["response"]) == ("m1", 200, "DRINK WATER")
+    ws.incoming.put({"type": "ping"})
+    assert ws.next_frame("pong") == {"type": "pong"}
+    ws.incoming.put(CLOSED)
+
+
+def test_messages_past_the_in_flight_limit_are_rejected():
+    release = threading.Event()
+
+    def slow(message, history, deadline, on_delta, key):
+        release.wait(2)
+        return {"response": message}, 200
+
+    ws, _ = serving(slow, max_in_flight=1)
+    ws.incoming.put({"type": "chat", "id": "m1", "message": "first"})
+    ws.incoming.put({"type": "chat", "id": "m2", "message": "second"})
+    assert ws.next_frame("error") == {"type": "error", "id": "m2", "error": "too many messages in flight"}
+    release.set()
+    assert ws.next_frame("done")["id"] == "m1"
+    ws.incoming.put(CLOSED)
+
+
+def test_cancel_frames_and_dropped_connections_cancel_unkeyed_turns():
+    started = threading.Event()
+    outcomes = queue.Queue()
+
+    def waiting(message, history, deadline, on_delta, key):
+        started.set()
+        while True:
+            try:
+                deadline.check("waiting")
+            except RequestCancelled:
+                outcomes.put((message, "cancelled"))
+                raise
+            if deadline.remaining() < 4:
+                outcomes.put((message, "finished"))
+                return {"response": message}, 200
+
+    speculations = FakeSpeculations()
+    ws, thread = serving(waiting, speculations)
+    ws.incoming.put({"type": "chat", "id": "spec", "message": "spec", "speculative": True})
+    started.wait(2)
+    ws.incoming.put({"type": "cancel", "id": "spec"})
+    assert outcomes.get(timeout=2) == ("spec", "cancelled")
+    assert speculations.registered == ["spec"] and speculations.cancelled == ["spec"]
+
+    ws.incoming.put({"type": "chat", "id": "plain", "message": "plain"})
+    ws.incoming.put({"type": "chat", "id": "keyed", "message": "keyed", "key": "k1"})
+    ws.incoming.put(CLOSED)
+    thread.join(2)
+    assert sorted([outcomes.get(timeout=5), outcomes.get(timeout=5)]) == [("keyed", "finished"),
+                                                                          ("plain", "cancelled")]
+
+
+def test_idle_connections_are_closed():
+    ws, thread = serving(heartbeat=0.01)
+    thread.join(2)
+    assert ws.closed
+
+
+def test_slots_are_limited_per_process():
+    before = ChatChannel.stats()
+    assert ChatChannel.admit(before["open"] + 1)
+    assert not ChatChannel.admit(before["open"] + 1)
+    assert ChatChannel.admit(0)
+    ChatChannel.release()
+    ChatChannel.release()
+    after = ChatChannel.stats()
+    assert after["open"] == before["open"]
+    assert after["refused"] == before["refused"] + 1
+
+
+@pytest.mark.skipif(index.Sock is None, reason="flask-sock is not installed")
+def test_upgrade_is_refused_once_the_slots_are_taken(monkeypatch):
+    monkeypatch.setattr(index, "WS_MAX_CHANNELS", ChatChannel.stats()["open"] + 1)
+    assert ChatChannel.admit(index.WS_MAX_CHANNELS)
+    try:
+        response = index.app.test_client().get("/api/ws")
+        assert response.status_code == 503
+    finally:
+        ChatChannel.release()
+    # A request that takes the slot gives it back however its handshake ends
+    index.app.test_client().get("/api/ws")
+    assert ChatChannel.stats()["open"] == index.WS_MAX_CHANNELS - 1
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from api import index
+from api.followups import FollowUps, answer_key
+from api.store import MemoryStore
+
+
+def completion(text):
+    return json.dumps({"choices": [{"message": {"content": text}}],
+                       "usage": {"prompt_tokens": 10, "completion_tokens": 5}}).encode("utf-8")
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replace the OpenAI API with a queue of canned replies (bytes, exceptions or functions returning either)"""
+    replies = []
+    calls = []
+
+    def send_upstream(body, deadline, on_chunk=None):
+        calls.append(json.loads(body))
+        reply = replies.pop(0)
+        if callable(reply):
+            reply = reply()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(index, "send_upstream", send_upstream)
+    monkeypatch.setattr(index, "UPSTREAM_RETRIES", 0)
+    monkeypatch.setattr(index, "RESPONSE_CACHE_TTL", 0)
+    monkeypatch.setattr(index, "get_followups", lambda: None)
+    monkeypatch.setattr(index, "get_summarizer", lambda: None)
+    return replies, calls
+
+
+def ask(client, message, key=None, session="test-session"):
+    headers = {"X-Session-Id": session}
+    if key:
+        headers["Idempotency-Key"] = key
+    return client.post("/api/chat", json={"message": message, "history": []}, headers=headers)
+
+
+def test_upstream_failure_is_an_error_and_is_retried_with_the_same_key(upstream):
+    replies, calls = upstream
+    replies.extend([index.UpstreamError(500, "boom"), completion("Rest and fluids.")])
+    client = index.app.test_client()
+
+    failed = ask(client, "what should I do about zorblax syndrome", key="retry-key")
+    assert failed.status_code == 502
+    assert failed.get_json()["error"] is True
+
+    retried = ask(client, "what should I do about zorblax syndrome", key="retry-key")
+    assert retried.status_code == 200
+    assert retried.get_json()["response"] == "Rest and fluids."
+    assert "Idempotent-Replayed" not in retried.headers
+    assert len(calls) == 2
+
+
+def test_successful_answer_is_replayed(upstream):
+    replies, calls = upstream
+    replies.append(completion("Try a cold compress."))
+    client = index.app.test_client()
+
+    first = ask(client, "what helps with quarkitis flare ups", key="replay-key")
+    second = ask(client, "what helps with quarkitis flare ups", key="replay-key")
+    assert first.get_json() == second.get_json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert len(calls) == 1
+
+
+def test_emergencies_never_reach_the_upstream(upstream):
+    _, calls = upstream
+    response = ask(index.app.test_client(), "my husband has crushing chest pain")
+    assert response.get_json()["source"] == "triage"
+    assert calls == []
+
+
+def test_qualified_question_goes_to_the_model(upstream):
+    replies, calls = upstream
+    replies.append(completion("Newborns sleep 14-17 hours a day."))
+    response = ask(index.app.test_client(), "how much sleep does my newborn baby need")
+    assert response.get_json()["response"] == "Newborns sleep 14-17 hours a day."
+    assert len(calls) == 1
+
+
+@pytest.fixture
+def precomputed(monkeypatch):
+    """Follow-ups holding a precomputed answer to one question, asked with an empty history"""
+    suggestions = FollowUps(MemoryStore(), lambda conversation, account: ([], {}), lambda *args: None)
+    key = answer_key("followup-session", [], "what helps with glimmer fatigue")
+    suggestions.store.set("followup-answers", key, {"body": {"response": "Precomputed rest advice."},
+                                                    "usage": {"prompt_tokens": 10, "completion_tokens": 5}})
+    monkeypatch.setattr(index, "get_followups", lambda: suggestions)
+    return suggestions.store, key
+
+
+def test_precomputed_answer_is_served_without_a_call(upstream, precomputed):
+    _, calls = upstream
+    response = ask(index.app.test_client(), "what helps with glimmer fatigue", session="followup-session")
+    assert response.get_json()["source"] == "precomputed"
+    assert response.get_json()["response"] == "Precomputed rest advice."
+    assert calls == []
+
+
+def test_precomputed_answer_is_not_served_past_the_quota(upstream, precomputed, monkeypatch):
+    store, key = precomputed
+    monkeypatch.setattr(index.get_usage(), "check", lambda *args: "reject")
+    response = ask(index.app.test_client(), "what helps with glimmer fatigue", session="followup-session")
+    assert response.status_code == 429
+    assert store.get("followup-answers", key) is not None
+
+
+def test_speculation_withdrawn_during_the_call_is_not_the_users_turn(upstream, monkeypatch):
+    replies, calls = upstream
+    logged = []
+    monkeypatch.setattr(index, "log_turn", lambda *args, **kwargs: logged.append(args))
+
+    def answered_then_withdrawn():
+        assert index.get_speculations().cancel("spec-1")
+        return completion("Speculative answer.")
+
+    replies.append(answered_then_withdrawn)
+    usage = index.get_usage()
+    model_tokens = usage.tokens_used("model", index.OPENAI_MODEL)
+    response = index.app.test_client().post(
+        "/api/chat", json={"message": "what helps with plimsoll cramps", "history": []},
+        headers={"X-Session-Id": "spec-session", "X-Speculation-Id": "spec-1"})
+    assert response.get_json()["cancelled"] is True
+    assert len(calls) == 1
+    assert logged == []
+    assert usage.tokens_used("session", "spec-session") == 0
+    assert usage.tokens_used("model", index.OPENAI_MODEL) == model_tokens + 15
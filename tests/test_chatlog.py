@@ -0,0 +1,83 @@
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from api.chatlog import ConversationLogger
+
+
+def read_files(directory):
+    """Records per log file, oldest file first"""
+    files = sorted(glob.glob(os.path.join(directory, "*.jsonl.gz")), key=lambda path: path.rsplit("-", 1)[1])
+    return [[json.loads(line) for line in gzip.open(path).read().splitlines()] for path in files]
+
+
+def test_records_are_redacted_and_written(tmp_path):
+    log = ConversationLogger(str(tmp_path), flush_interval=0.05)
+    log.log({"message": "mail me at jo@example.com or +44 20 7946 0958", "response": "ok"})
+    log.close()
+    assert read_files(str(tmp_path)) == [[{"message": "mail me at [email] or [phone]", "response": "ok"}]]
+
+
+def test_rotates_when_a_file_grows_past_the_limit(tmp_path):
+    log = ConversationLogger(str(tmp_path), batch_size=1, flush_interval=0.05, max_file_bytes=70)
+    for i in range(4):
+        log.log({"message": "message number %d" % i})
+        log.flush()
+    log.close()
+    files = read_files(str(tmp_path))
+    assert len(files) == 2
+    assert [record["message"] for records in files for record in records] == \
+        ["message number %d" % i for i in range(4)]
+
+
+def test_rotates_when_a_file_gets_old(tmp_path):
+    log = ConversationLogger(str(tmp_path), flush_interval=0.05, rotate_seconds=0.2)
+    log.log({"message": "first"})
+    log.flush()
+    time.sleep(0.3)
+    log.log({"message": "second"})
+    log.close()
+    assert read_files(str(tmp_path)) == [[{"message": "first"}], [{"message": "second"}]]
+
+
+def test_full_queue_sheds_instead_of_blocking(tmp_path):
+    release = threading.Event()
+    writing = threading.Event()
+
+    def stall(record):
+        writing.set()
+        release.wait(5)
+        return record
+
+    log = ConversationLogger(str(tmp_path), max_queue=2, batch_size=1, overflow="drop", redactors=[stall])
+    log.log({"message": "in the writer"})
+    writing.wait(5)
+    assert log.log({"message": "a"}) and log.log({"message": "b"})
+    assert not log.log({"message": "c"})
+    assert log.stats()["dropped"] == 1
+    release.set()
+    log.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_worker_leaves_the_parent_file_intact(tmp_path):
+    log = ConversationLogger(str(tmp_path), flush_interval=0.05)
+    log.log({"message": "parent"})
+    log.flush()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            log.log({"message": "child"})
+            log.close()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    log.log({"message": "parent again"})
+    log.close()
+    messages = sorted(record["message"] for records in read_files(str(tmp_path)) for record in records)
+    assert messages == ["child", "parent", "parent again"]
@@ -0,0 +1,68 @@
+import socket
+import time
+
+import pytest
+
+from api import index
+from api.deadline import Deadline, DeadlineExceeded, RequestCancelled
+
+
+def test_remaining_counts_down_and_never_goes_negative():
+    deadline = Deadline(0.05)
+    assert 0 < deadline.remaining() <= 0.05
+    time.sleep(0.06)
+    assert deadline.remaining() == 0.0
+    assert deadline.expired()
+
+
+def test_check_raises_once_expired():
+    Deadline(1).check("fresh")
+    with pytest.raises(DeadlineExceeded) as info:
+        Deadline(0).check("late stage")
+    assert info.value.stage == "late stage"
+
+
+def test_cancel_runs_callbacks_and_raises_request_cancelled():
+    deadline = Deadline(10)
+    calls = []
+    deadline.on_cancel(lambda: calls.append("first"))
+    deadline.cancel()
+    deadline.on_cancel(lambda: calls.append("late"))
+    assert calls == ["first", "late"]
+    with pytest.raises(RequestCancelled):
+        deadline.check("after cancel")
+
+
+def test_timeout_is_capped_and_never_zero():
+    deadline = Deadline(10)
+    assert deadline.timeout("read", cap=2) == 2
+    assert 9 < deadline.timeout("read") <= 10
+
+
+@pytest.fixture
+def unresponsive_upstream(monkeypatch):
+    """A listener whose accept queue is full, so new connections hang"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(0)
+    fillers = []
+    for _ in range(8):
+        filler = socket.socket()
+        filler.setblocking(False)
+        try:
+            filler.connect(server.getsockname())
+        except BlockingIOError:
+            pass
+        fillers.append(filler)
+    monkeypatch.setattr(index, "OPENAI_API_HOST", "127.0.0.1:%d" % server.getsockname()[1])
+    monkeypatch.setattr(index, "OPENAI_API_TLS", False)
+    yield
+    for sock in fillers + [server]:
+        sock.close()
+
+
+def test_slow_connect_ends_with_the_deadline(unresponsive_upstream):
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        index.send_upstream(b"{}", Deadline(0.5))
+    assert time.monotonic() - started < 1.5
@@ -0,0 +1,86 @@
+from api.followups import FollowUps
+from api.store import MemoryStore
+
+CONVERSATION = [{"role": "user", "content": "I have a headache"},
+                {"role": "assistant", "content": "Rest and drink water."}]
+USAGE = {"prompt_tokens": 40, "completion_tokens": 10}
+
+
+def suggest(conversation, account):
+    return ["How much water?", "When should I see a doctor?", "Can I take ibuprofen?", "Extra?"], USAGE
+
+
+def precompute(question, conversation, account):
+    if "doctor" in question:
+        return None
+    return {"response": "Answer to " + question}, USAGE
+
+
+def followups(**kwargs):
+    kwargs.setdefault("precompute_count", 2)
+    return FollowUps(MemoryStore(), suggest, precompute, count=3, poll_interval=0.01, **kwargs)
+
+
+def prepared(followups, session="s1"):
+    token = followups.schedule(session, CONVERSATION)
+    followups._queue.join()
+    return token
+
+
+def test_suggestions_are_published_under_the_token():
+    suggestions = followups()
+    record = suggestions.questions(prepared(suggestions), wait=2)
+    assert record == {"status": "ready",
+                      "questions": ["How much water?", "When should I see a doctor?", "Can I take ibuprofen?"]}
+
+
+def test_precomputed_answer_is_served_once_for_the_same_conversation():
+    suggestions = followups()
+    prepared(suggestions)
+    assert suggestions.take("other-session", CONVERSATION, "How much water?") is None
+    assert suggestions.take("s1", CONVERSATION[:1], "How much water?") is None
+    body, usage = suggestions.take("s1", CONVERSATION, "  how much WATER?")
+    assert body == {"response": "Answer to How much water?"}
+    assert usage == USAGE
+    assert suggestions.take("s1", CONVERSATION, "How much water?") is None
+
+
+def test_questions_answered_locally_are_not_precomputed():
+    suggestions = followups()
+    prepared(suggestions)
+    assert suggestions.take("s1", CONVERSATION, "When should I see a doctor?") is None
+    stats = suggestions.stats()
+    assert stats["precomputed"] == 1
+    assert stats["suggest_tokens"] == 50
+
+
+def test_stats_report_hits_and_wasted_tokens():
+    suggestions = followups(precompute_count=3)
+    prepared(suggestions)
+    suggestions.take("s1", CONVERSATION, "How much water?")
+    stats = suggestions.stats()
+    assert (stats["turns"], stats["suggested"], stats["precomputed"], stats["hits"]) == (1, 3, 2, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["wasted_token_ratio"] == 0.5
+
+
+def test_exhausted_budget_skips_the_upstream():
+    suggestions = followups(daily_tokens=60)
+    prepared(suggestions)
+    token = prepared(suggestions)
+    assert suggestions.questions(token) == {"status": "ready", "questions": []}
+    assert suggestions.stats()["skipped_budget"] >= 1
+
+
+def test_failed_suggestion_publishes_an_empty_list():
+    def broken(conversation, account):
+        raise RuntimeError("upstream down")
+
+    suggestions = FollowUps(MemoryStore(), broken, precompute, poll_interval=0.01)
+    token = prepared(suggestions)
+    assert suggestions.questions(token) == {"status": "ready", "questions": []}
+    assert suggestions.stats()["failed"] == 1
+
+
+def test_turns_without_a_session_get_no_token():
+    assert followups().schedule(None, CONVERSATION) is None
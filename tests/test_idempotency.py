@@ -0,0 +1,110 @@
+import threading
+import time
+
+from api.deadline import Deadline
+from api.idempotency import IdempotencyKeys
+from api.store import MemoryStore
+
+
+def keys():
+    return IdempotencyKeys(MemoryStore(), ttl=60, poll_interval=0.01)
+
+
+def counting(*results):
+    """A turn that returns the given (body, status) pairs in order, counting its calls"""
+    calls = []
+
+    def run():
+        calls.append(1)
+        return results[min(len(calls), len(results)) - 1]
+    return run, calls
+
+
+def test_success_is_replayed_without_running_again():
+    idempotency = keys()
+    run, calls = counting(({"response": "hi"}, 200))
+    assert idempotency.run("k", ["q", []], run, Deadline(5)) == ({"response": "hi"}, 200, False)
+    assert idempotency.run("k", ["q", []], run, Deadline(5)) == ({"response": "hi"}, 200, True)
+    assert len(calls) == 1
+
+
+def test_upstream_failure_is_not_replayed():
+    idempotency = keys()
+    run, calls = counting(({"response": "sorry", "error": True}, 502), ({"response": "hi"}, 200))
+    assert idempotency.run("k", ["q", []], run, Deadline(5))[1] == 502
+    body, status, replayed = idempotency.run("k", ["q", []], run, Deadline(5))
+    assert (body, status, replayed) == ({"response": "hi"}, 200, False)
+    assert len(calls) == 2
+
+
+def test_degraded_and_cancelled_turns_release_the_key():
+    idempotency = keys()
+    run, calls = counting(({"response": "partial", "degraded": True}, 200),
+                          ({"response": None, "cancelled": True}, 200),
+                          ({"response": "hi"}, 200))
+    for _ in range(3):
+        idempotency.run("k", ["q", []], run, Deadline(5))
+    assert len(calls) == 3
+    assert idempotency.run("k", ["q", []], run, Deadline(5))[2] is True
+
+
+def test_exception_releases_the_key():
+    idempotency = keys()
+
+    def boom():
+        raise RuntimeError("boom")
+
+    try:
+        idempotency.run("k", ["q", []], boom, Deadline(5))
+    except RuntimeError:
+        pass
+    run, calls = counting(({"response": "hi"}, 200))
+    assert idempotency.run("k", ["q", []], run, Deadline(5))[1] == 200
+    assert len(calls) == 1
+
+
+def test_reused_key_with_different_payload_is_rejected():
+    idempotency = keys()
+    run, _ = counting(({"response": "hi"}, 200))
+    idempotency.run("k", ["q", []], run, Deadline(5))
+    body, status, replayed = idempotency.run("k", ["other", []], run, Deadline(5))
+    assert status == 422
+    assert not replayed
+
+
+def test_concurrent_duplicates_run_once():
+    idempotency = keys()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"response": "hi"}, 200
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(idempotency.run("k", ["q", []], slow, Deadline(5))))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(replayed for _, _, replayed in results) == [False, True, True]
+    assert idempotency.stats()["attached"] == 2
+
+
+def test_waiting_on_a_running_duplicate_is_bounded_by_the_deadline():
+    idempotency = keys()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.5)
+        return {"response": "hi"}, 200
+
+    thread = threading.Thread(target=idempotency.run, args=("k", ["q", []], slow, Deadline(5)))
+    thread.start()
+    started.wait()
+    body, status, replayed = idempotency.run("k", ["q", []], slow, Deadline(0.05))
+    thread.join()
+    assert status == 409
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from api.jobs import JobQueue
+from api.store import MemoryStore, SQLiteStore
+
+
+def blocking_run(started, release):
+    """A turn that waits for `release` or for its deadline to be cancelled"""
+    def run(payload, deadline):
+        started.set()
+        while not (release.is_set() or deadline.cancelled):
+            time.sleep(0.005)
+        if deadline.cancelled:
+            return {"response": None, "cancelled": True}, 200
+        return {"response": "late answer"}, 200
+    return run
+
+
+def jobs(store, run, **kwargs):
+    kwargs.setdefault("cancel_check_interval", 0.01)
+    return JobQueue(store, run, poll_interval=0.01, **kwargs)
+
+
+def test_finished_job_returns_its_result():
+    queue = jobs(MemoryStore(), lambda payload, deadline: ({"response": payload["message"].upper()}, 200))
+    job_id = queue.submit({"message": "hi"})
+    record = queue.get(job_id, wait=2)
+    assert record["status"] == "done"
+    assert record["result"] == {"response": "HI"}
+    assert record["http_status"] == 200
+    assert queue.stats()["completed"] == 1
+
+
+def test_failing_job_is_recorded_as_failed():
+    def run(payload, deadline):
+        raise RuntimeError("boom")
+
+    queue = jobs(MemoryStore(), run)
+    record = queue.get(queue.submit({}), wait=2)
+    assert record["status"] == "failed"
+    assert record["error"] == "boom"
+
+
+def test_cancelled_job_is_never_overwritten_by_its_result():
+    started, release = threading.Event(), threading.Event()
+    queue = jobs(MemoryStore(), blocking_run(started, release))
+    job_id = queue.submit({})
+    started.wait(2)
+    assert queue.cancel(job_id)
+    release.set()
+    assert queue.get(job_id, wait=2)["status"] == "cancelled"
+    time.sleep(0.05)
+    assert queue.get(job_id)["status"] == "cancelled"
+    assert not queue.cancel(job_id)
+
+
+def test_cancel_after_the_job_finished_keeps_its_result():
+    queue = jobs(MemoryStore(), lambda payload, deadline: ({"response": "hi"}, 200))
+    job_id = queue.submit({})
+    assert queue.get(job_id, wait=2)["status"] == "done"
+    assert not queue.cancel(job_id)
+    assert queue.get(job_id)["result"] == {"response": "hi"}
+
+
+def test_cancel_losing_to_a_concurrent_finish_is_refused():
+    store = MemoryStore()
+    queue = jobs(store, lambda payload, deadline: ({"response": "hi"}, 200))
+    store.set("jobs", "j", {"status": "running", "created": time.time()})
+    assert queue._claim("j", "done")
+    assert not queue.cancel("j")
+    assert store.get("jobs", "j")["status"] == "running"
+
+
+def test_cancel_through_another_worker_stops_the_job(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    started, release = threading.Event(), threading.Event()
+    owner = jobs(SQLiteStore(path), blocking_run(started, release))
+    other = jobs(SQLiteStore(path), blocking_run(threading.Event(), threading.Event()))
+    job_id = owner.submit({})
+    started.wait(2)
+    assert other.cancel(job_id)
+    assert owner.get(job_id, wait=2)["status"] == "cancelled"
+    stop = time.monotonic() + 2
+    while owner.stats()["running"] and time.monotonic() < stop:
+        time.sleep(0.01)
+    assert owner.stats()["running"] == 0
+    release.set()
+
+
+def test_full_queue_rejects_new_jobs():
+    started, release = threading.Event(), threading.Event()
+    queue = jobs(MemoryStore(), blocking_run(started, release), workers=1, max_pending=1)
+    running = queue.submit({})
+    started.wait(2)
+    assert queue.submit({}) is not None
+    assert queue.submit({}) is None
+    assert queue.stats()["rejected"] == 1
+    release.set()
+    assert queue.get(running, wait=2)["status"] == "done"
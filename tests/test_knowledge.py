@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from api.knowledge import KnowledgeBase, tokenize
+
+FAQ_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "api", "data", "health_faq.json")
+THRESHOLD = 0.75
+
+
+@pytest.fixture(scope="module")
+def knowledge_base():
+    return KnowledgeBase.load(FAQ_PATH)
+
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert tokenize("What are the remedies for headaches?") == ["remedy", "headache"]
+
+
+@pytest.mark.parametrize("query, entry_id", [
+    ("how much sleep do I need", "sleep-duration"),
+    ("what are the benefits of walking", "walking-benefits"),
+    ("how much water should I drink a day", "water-intake"),
+    ("what is a normal blood pressure", "blood-pressure-normal"),
+    ("how many hours of sleep do adults need", "sleep-duration"),
+])
+def test_answers_known_questions(knowledge_base, query, entry_id):
+    match = knowledge_base.answer(query, THRESHOLD)
+    assert match is not None
+    assert match.entry["id"] == entry_id
+
+
+@pytest.mark.parametrize("query", [
+    "how much sleep does my newborn baby need",
+    "is walking good for my broken ankle",
+    "what is a normal blood pressure for a newborn",
+    "what is a normal blood pressure after a stroke",
+    "what blood pressure is considered high for kids",
+    "what is a normal blood pressure for a teenager",
+])
+def test_unknown_qualifiers_lower_confidence(knowledge_base, query):
+    # Terms the index has never seen change the question; the model should answer it
+    assert knowledge_base.answer(query, THRESHOLD) is None
+
+
+def test_no_match_for_unrelated_query(knowledge_base):
+    assert knowledge_base.answer("zzzz qqqq", THRESHOLD) is None
+
+
+def test_every_curated_phrasing_is_answered(knowledge_base):
+    for entry in knowledge_base.entries:
+        for question in entry["questions"]:
+            match = knowledge_base.answer(question, THRESHOLD)
+            assert match is not None and match.entry["id"] == entry["id"], question
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from api.rum import MAX_VALUE_MS, METRICS, LogHistogram, RumAggregator
+from api.store import MemoryStore
+
+
+def test_quantiles_are_within_the_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(6, 1.5) + 1 for _ in range(5000))
+    sketch = LogHistogram(0.02)
+    for value in values:
+        sketch.add(value)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.02)
+
+
+def test_values_below_a_millisecond_share_the_zero_bucket():
+    sketch = LogHistogram()
+    sketch.add(0.2)
+    sketch.add(1.0)
+    assert sketch.counts == {0: 2}
+    assert sketch.quantile(0.5) == 0.0
+    assert LogHistogram().quantile(0.5) == 0.0
+
+
+def test_sketches_merge_by_adding_bucket_counts():
+    left, right, both = LogHistogram(), LogHistogram(), LogHistogram()
+    for value in range(1, 200):
+        (left if value % 2 else right).add(value)
+        both.add(value)
+    merged = LogHistogram()
+    for sketch in (left, right):
+        for bucket, count in sketch.counts.items():
+            merged.add_bucket(bucket, count)
+    assert merged.counts == both.counts
+    assert merged.quantile(0.9) == both.quantile(0.9)
+
+
+def test_workers_merge_into_one_daily_summary():
+    store = MemoryStore()
+    first, second = RumAggregator(store, flush_interval=0), RumAggregator(store, flush_interval=0)
+    first.record([{"metric": "page.ttfb", "value": 100}] * 2)
+    second.record([{"metric": "page.ttfb", "value": 400}] * 2)
+    summary = second.summary()["metrics"]["page.ttfb"]
+    assert summary["count"] == 4
+    assert summary["p50"] == pytest.approx(100, rel=0.02)
+    assert summary["p75"] == pytest.approx(400, rel=0.02)
+
+
+def test_unknown_metrics_and_implausible_values_are_rejected():
+    rum = RumAggregator(MemoryStore(), flush_interval=0)
+    accepted = rum.record([{"metric": "page.ttfb", "value": 12}, {"metric": "made.up", "value": 12},
+                           {"metric": "page.ttfb", "value": -1}, {"metric": "page.ttfb", "value": True},
+                           {"metric": "page.ttfb", "value": MAX_VALUE_MS + 1}, "not an event"])
+    assert accepted == 1
+    assert (rum.accepted, rum.rejected) == (1, 5)
+
+
+def test_store_keys_are_bounded_however_varied_the_traffic():
+    store = MemoryStore()
+    rum = RumAggregator(store, flush_interval=0)
+    rng = random.Random(1)
+    metrics = sorted(METRICS)
+    rum.record([{"metric": rng.choice(metrics), "value": rng.uniform(0, MAX_VALUE_MS)} for _ in range(20000)])
+    assert store.stats()["entries"]["rum"] <= rum.max_entries()
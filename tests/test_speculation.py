@@ -0,0 +1,65 @@
+import time
+
+from api.deadline import Deadline
+from api.speculation import SpeculationRegistry
+from api.store import MemoryStore, SQLiteStore
+
+
+def registry(store=None):
+    return SpeculationRegistry(store or MemoryStore(), poll_interval=0.01)
+
+
+def counts(speculations):
+    stats = speculations.stats()
+    return stats["started"], stats["completed"], stats["cancelled"], stats["wasted"]
+
+
+def test_cancel_aborts_a_running_speculation():
+    speculations, deadline = registry(), Deadline(5)
+    speculations.register("s1", deadline)
+    assert speculations.cancel("s1")
+    assert deadline.cancelled
+    speculations.finish("s1")
+    assert counts(speculations) == (1, 0, 1, 1)
+    assert speculations.stats()["waste_rate"] == 1.0
+
+
+def test_cancel_arriving_first_stops_the_request_when_it_registers():
+    speculations, deadline = registry(), Deadline(5)
+    assert not speculations.cancel("s1")
+    speculations.register("s1", deadline)
+    assert deadline.cancelled
+    assert counts(speculations) == (1, 0, 1, 1)
+
+
+def test_discarding_a_finished_answer_is_waste_but_not_a_cancel():
+    speculations = registry()
+    speculations.register("s1", Deadline(5))
+    speculations.finish("s1")
+    assert not speculations.cancel("s1")
+    assert not speculations.cancel("s1")
+    assert counts(speculations) == (1, 1, 0, 1)
+
+
+def test_stray_cancels_are_not_waste():
+    speculations = registry()
+    speculations.register("s1", Deadline(5))
+    speculations.finish("s1")
+    assert not speculations.cancel("never-sent")
+    assert not speculations.cancel("")
+    assert counts(speculations) == (1, 1, 0, 0)
+
+
+def test_cancel_through_another_worker_stops_the_request(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    owner, other = registry(SQLiteStore(path)), registry(SQLiteStore(path))
+    deadline = Deadline(5)
+    owner.register("s1", deadline)
+    assert other.cancel("s1")
+    stop = time.monotonic() + 2
+    while not deadline.cancelled and time.monotonic() < stop:
+        time.sleep(0.01)
+    assert deadline.cancelled
+    assert owner.stats()["in_flight"] == 0
+    owner.finish("s1")
+    assert counts(other) == (1, 0, 1, 1)
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from api.store import MemoryStore, SQLiteStore
+from api.usage import UsageTracker
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore()
+    return SQLiteStore(str(tmp_path / "store.sqlite3"))
+
+
+def test_get_set_delete(store):
+    assert store.get("ns", "k") is None
+    assert store.get("ns", "k", 0) == 0
+    store.set("ns", "k", {"a": [1, 2]})
+    assert store.get("ns", "k") == {"a": [1, 2]}
+    assert store.get("other", "k") is None
+    store.delete("ns", "k")
+    assert store.get("ns", "k") is None
+
+
+def test_add_only_sets_absent_keys(store):
+    assert store.add("ns", "k", 1)
+    assert not store.add("ns", "k", 2)
+    assert store.get("ns", "k") == 1
+
+
+def test_add_replaces_expired_keys(store):
+    assert store.add("ns", "k", 1, ttl=0.05)
+    time.sleep(0.1)
+    assert store.get("ns", "k") is None
+    assert store.add("ns", "k", 2, ttl=10)
+    assert store.get("ns", "k") == 2
+
+
+def test_incr_counts_and_restarts_after_expiry(store):
+    assert store.incr("ns", "c", ttl=0.05) == 1
+    assert store.incr("ns", "c", 4) == 5
+    time.sleep(0.1)
+    assert store.incr("ns", "c", ttl=10) == 1
+
+
+def test_incr_keeps_fractional_amounts(store):
+    store.incr("ns", "cost", 0.25)
+    assert store.incr("ns", "cost", 0.5) == pytest.approx(0.75)
+
+
+def test_scan_filters_namespace_prefix_and_expiry(store):
+    store.set("ns", "day1|a", 1)
+    store.set("ns", "day1|b", 2)
+    store.set("ns", "day2|a", 3)
+    store.set("other", "day1|c", 4)
+    store.set("ns", "day1|gone", 5, ttl=0.05)
+    time.sleep(0.1)
+    assert sorted(store.scan("ns", "day1|")) == [("day1|a", 1), ("day1|b", 2)]
+
+
+def test_add_is_atomic_across_threads(store):
+    winners = []
+    barrier = threading.Barrier(8)
+
+    def claim(i):
+        barrier.wait()
+        if store.add("locks", "k", i):
+            winners.append(i)
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+
+
+def test_incr_is_atomic_across_threads(store):
+    def bump():
+        for _ in range(50):
+            store.incr("ns", "c")
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get("ns", "c") == 200
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    first, second = SQLiteStore(path), SQLiteStore(path)
+    assert first.add("ns", "k", "first")
+    assert not second.add("ns", "k", "second")
+    first.incr("ns", "c", 2)
+    assert second.incr("ns", "c", 3) == 5
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryStore(max_entries=2)
+    store.set("ns", "a", 1)
+    store.set("ns", "b", 2)
+    store.get("ns", "a")
+    store.set("ns", "c", 3)
+    assert store.get("ns", "b") is None
+    assert store.get("ns", "a") == 1
+
+
+def test_pinned_namespaces_are_never_evicted():
+    store = MemoryStore(max_entries=10, pinned=("usage",))
+    store.set("usage", "quota", 90000)
+    for i in range(100):
+        store.incr("ratelimit", "client%d" % i)
+    assert store.get("usage", "quota") == 90000
+    assert store.stats()["entries"] == {"ratelimit": 10, "usage": 1}
+
+
+def test_usage_quota_survives_cache_churn():
+    store = MemoryStore(max_entries=100, pinned=("usage",))
+    usage = UsageTracker(store, flush_interval=0)
+    usage.record("client", "session", "gpt-4", {"prompt_tokens": 60000, "completion_tokens": 30000}, 0.1)
+    for i in range(500):
+        store.incr("ratelimit", "other%d:1" % i, ttl=120)
+    assert usage.tokens_used("client", "client") == 90000
+    assert usage.check("client", "session", 100000, 0, 0.8) == "downgrade"
+    assert usage.check("client", "session", 90000, 0, 0.8) == "reject"
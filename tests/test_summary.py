@@ -0,0 +1,76 @@
+from api.store import MemoryStore
+from api.summary import ConversationSummarizer
+
+
+def turns(count, prefix="turn"):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": "%s %d" % (prefix, i)} for i in range(count)]
+
+
+def summarizer(calls=None, store=None):
+    def summarize(previous, folded, account):
+        if calls is not None:
+            calls.append((previous, [turn["content"] for turn in folded]))
+        return (previous + " + " if previous else "") + "summary of %d turns" % len(folded)
+    return ConversationSummarizer(store or MemoryStore(), summarize, threshold=12, keep=6)
+
+
+def folded(summaries, conversation, history):
+    summaries.schedule(conversation, history)
+    summaries._queue.join()
+
+
+def test_short_histories_are_sent_as_they_are():
+    summaries = summarizer()
+    history = turns(12)
+    folded(summaries, "c1", history)
+    assert summaries.stats()["scheduled"] == 0
+    assert summaries.condense("c1", history) == history
+
+
+def test_older_turns_are_replaced_by_the_summary():
+    summaries = summarizer()
+    history = turns(14)
+    folded(summaries, "c1", history)
+    condensed = summaries.condense("c1", history + turns(2, "new"))
+    assert condensed[0] == {"role": "system",
+                            "content": "Summary of the earlier conversation:\nsummary of 8 turns"}
+    assert condensed[1:] == history[8:] + turns(2, "new")
+
+
+def test_extensions_fold_only_the_new_turns_into_the_previous_summary():
+    calls = []
+    summaries = summarizer(calls)
+    history = turns(14)
+    folded(summaries, "c1", history)
+    folded(summaries, "c1", turns(20))
+    assert len(calls) == 1
+    folded(summaries, "c1", turns(21))
+    assert calls[1] == ("summary of 8 turns", ["turn %d" % i for i in range(8, 15)])
+    assert summaries.condense("c1", turns(21))[1:] == turns(21)[15:]
+
+
+def test_a_history_that_no_longer_matches_is_sent_in_full():
+    summaries = summarizer()
+    folded(summaries, "c1", turns(14))
+    edited = turns(14, "edited")
+    assert summaries.condense("c1", edited) == edited
+    assert summaries.condense("c1", turns(4)) == turns(4)
+    assert summaries.stats()["stale"] == 2
+
+
+def test_summaries_are_shared_through_the_store():
+    store = MemoryStore()
+    folded(summarizer(store=store), "c1", turns(14))
+    assert summarizer(store=store).condense("c1", turns(14))[0]["role"] == "system"
+
+
+def test_failed_summary_leaves_the_history_untouched_and_unlocked():
+    def broken(previous, folded, account):
+        raise RuntimeError("upstream down")
+
+    store = MemoryStore()
+    summaries = ConversationSummarizer(store, broken, threshold=12, keep=6)
+    folded(summaries, "c1", turns(14))
+    assert summaries.stats()["failed"] == 1
+    assert summaries.condense("c1", turns(14)) == turns(14)
+    assert store.get("summary-locks", "c1") is None
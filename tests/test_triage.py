@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from api.triage import TriageClassifier, normalize
+
+LEXICON_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "api", "data", "triage_lexicon.json")
+
+
+@pytest.fixture(scope="module")
+def triage():
+    return TriageClassifier.load(LEXICON_PATH)
+
+
+def test_normalize_pads_and_collapses_punctuation():
+    assert normalize("Chest  PAIN!!") == " chest pain "
+
+
+@pytest.mark.parametrize("message, category", [
+    ("I have crushing chest pain right now", "cardiac_emergency"),
+    ("my dad CAN'T BREATHE", "breathing_emergency"),
+    ("I think I took too many pills", "poisoning_overdose"),
+])
+def test_emergencies_are_high_severity(triage, message, category):
+    result = triage.classify(message)
+    assert result.severity == "high"
+    assert result.category == category
+    assert result.response
+
+
+def test_most_severe_category_wins_and_all_tags_are_kept(triage):
+    result = triage.classify("my baby has a high fever and is not breathing")
+    assert result.category == "breathing_emergency"
+    assert {"pediatric", "urgent", "breathing_emergency"} <= set(result.tags)
+
+
+def test_phrases_match_on_word_boundaries_only():
+    classifier = TriageClassifier({"pain": {"severity": "low", "phrases": ["ache"]}})
+    assert classifier.matches("I have a headache") == set()
+    assert classifier.matches("a dull ache today") == {"pain"}
+
+
+def test_overlapping_phrases_are_all_found():
+    # "chest pain" and "pain spreading" share a word; the second is found through a failure link
+    classifier = TriageClassifier({
+        "a": {"severity": "high", "phrases": ["chest pain"]},
+        "b": {"severity": "low", "phrases": ["pain spreading"]},
+        "c": {"severity": "low", "phrases": ["spreading to my arm"]},
+    })
+    assert classifier.matches("chest pain spreading to my arm") == {"a", "b", "c"}
+    assert classifier.matches("pain spreading") == {"b"}
+
+
+def test_no_match(triage):
+    result = triage.classify("what is a healthy breakfast")
+    assert result.severity == "none"
+    assert result.tags == []